@@ -0,0 +1,239 @@
+"""
+Время методов DBManager и запросов бота на большой синтетической БД со сравнением с сохраненным эталоном.
+
+Запуск: python -m benchmarks.bench_db --db /tmp/cleanny_big.db
+Сохранить результаты как эталон: python -m benchmarks.bench_db --db /tmp/cleanny_big.db --save-baseline
+
+БД по пути --db создается при первом запуске (с миграциями) и переиспользуется при следующих, если ее размеры
+совпадают с параметрами; замеры выполняются на ее копии, чтобы записи не накапливались между запусками.
+Код завершения 1, если медиана какого-либо замера хуже эталонной больше чем в --threshold раз.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.synthetic_db import STAFF_TG_ID_BASE, STATUSES, USER_TG_ID_BASE, build_synthetic_db
+from cleanny_db_manager import DBManager
+from staff_assignment import BOOKINGS_QUERY, AssignmentEngine
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_db.json')
+
+ORDER_HISTORY_STATUSES = ('Принят', 'Завершен')
+
+
+def prepare_db(path: str, users: int, orders: int, staff: int, seed: int) -> None:
+    """
+    Создает синтетическую БД с миграциями, если файла нет или размеры БД не совпадают с переданными.
+    """
+
+    if os.path.exists(path):
+        manager = DBManager(path)
+        counts = tuple(
+            manager.fetch_all(f'SELECT COUNT(*) AS n FROM {table}')[0]['n'] for table in ('Users', 'Orders', 'Staff')
+        )
+        if counts == (users, orders, staff):
+            manager.migrate()
+            manager.close()
+            return
+        manager.close()
+
+    print(f'Генерация БД: {users} пользователей, {orders} заказов...')
+    started = time.perf_counter()
+    manager = build_synthetic_db(path, users, orders, staff, seed=seed)
+    manager.migrate()
+    manager.close()
+    print(f'БД создана за {time.perf_counter() - started:.1f} с')
+
+
+def db_cases(manager: DBManager, users: int, orders: int, staff: int, rnd: random.Random) -> dict:
+    """
+    Замеры: название -> функция без аргументов, выполняющая один вызов со случайными параметрами.
+    Пользователь с id 1 - самый активный клиент синтетической БД (больше всего заказов).
+    """
+
+    def user_id():
+        return rnd.randint(1, users)
+
+    def tg_id(ind: int = None):
+        return USER_TG_ID_BASE + (ind or user_id()) - 1
+
+    def order_id():
+        return rnd.randint(1, orders)
+
+    def staff_fio():
+        i = rnd.randrange(staff)
+        return manager.get_record('Staff', last_name=f'Фамилия{i}', first_name=f'Имя{i}', surname=f'Отчество{i}')
+
+    def orders_next_page(ind: int):
+        first = manager.get_orders_page(ind, ORDER_HISTORY_STATUSES, 5)
+        after = (first[-1]['order_date'], first[-1]['id']) if first else None
+        return manager.get_orders_page(ind, ORDER_HISTORY_STATUSES, 5, after=after)
+
+    def order_frequency_cold(ind: int = None):
+        tg = tg_id(ind)
+        manager.order_frequency.invalidate(tg)
+        return manager.get_order_frequency(tg)
+
+    def user_cold():
+        tg = tg_id()
+        manager.user_profiles.invalidate(tg)
+        return manager.get_user(tg)
+
+    # Пользователи, чьи профили и даты заказов уже в памяти (замеры кэша и счетчика)
+    hot_users = [tg_id() for _ in range(100)]
+    for tg in hot_users:
+        manager.get_user(tg)
+        manager.get_order_frequency(tg)
+
+    start, end = AssignmentEngine().horizon()
+    bookings_params = (
+        datetime.combine(start, datetime.min.time()).timestamp(),
+        datetime.combine(end, datetime.max.time()).timestamp()
+    )
+
+    def new_order():
+        return {
+            'appointment_datetime': time.time() + 86400,
+            'total_price': 119,
+            'total_time': 4.5,
+            'status': 'В обработке',
+            'address': 'Адрес',
+            'payment': 'Наличными',
+            'order_date': time.time(),
+            'user_id': user_id()
+        }
+
+    def insert_delete_job():
+        job = manager.insert_record('AutoAssignJobs', order_id=order_id(), msg_id=1, chat_id=1, run_at=0)
+        return manager.delete_records('AutoAssignJobs', id=job['id'])
+
+    return {
+        'get_staff_data': lambda: manager.get_staff_data(STAFF_TG_ID_BASE + rnd.randrange(staff)),
+        'get_record (Staff по ФИО)': staff_fio,
+        'get_records (OrdersServices)': lambda: manager.get_records('OrdersServices', order_id=order_id()),
+        'get_all_records (Services)': lambda: manager.get_all_records('Services'),
+        'get_order_details': lambda: manager.get_order_details(order_id()),
+        'get_orders_page': lambda: manager.get_orders_page(user_id(), ORDER_HISTORY_STATUSES, 5),
+        'get_orders_page (след., id 1)': lambda: orders_next_page(1),
+        'count_orders': lambda: manager.count_orders(user_id(), ORDER_HISTORY_STATUSES),
+        'count_orders (id 1)': lambda: manager.count_orders(1, ORDER_HISTORY_STATUSES),
+        'get_order_frequency (из БД)': order_frequency_cold,
+        'get_order_frequency (из БД, id 1)': lambda: order_frequency_cold(1),
+        'get_order_frequency (счетчик)': lambda: manager.get_order_frequency(rnd.choice(hot_users)),
+        'get_user (из БД)': user_cold,
+        'get_user (кэш)': lambda: manager.get_user(rnd.choice(hot_users)),
+        'BOOKINGS_QUERY (распределение)': lambda: manager.fetch_all(BOOKINGS_QUERY, bookings_params),
+        'insert_order (3 услуги)': lambda: manager.insert_order(new_order(), [
+            {'service_id': 1, 'quantity_services': 1},
+            {'service_id': 5, 'quantity_services': 1},
+            {'service_id': 7, 'quantity_services': 1}
+        ]),
+        'update_record (Orders)': lambda: manager.update_record('Orders', order_id(), status=rnd.choice(STATUSES)),
+        'insert_record + delete_records': insert_delete_job,
+    }
+
+
+def measure(func, repeat: int) -> dict:
+    """
+    :return: Среднее, медиана и 99-й процентиль времени вызова в миллисекундах.
+    """
+
+    func()
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings[i] = time.perf_counter() - started
+    timings *= 1000
+    return {
+        'mean': float(timings.mean()),
+        'p50': float(np.percentile(timings, 50)),
+        'p99': float(np.percentile(timings, 99))
+    }
+
+
+def environment(args) -> dict:
+    return {
+        'users': args.users,
+        'orders': args.orders,
+        'staff': args.staff,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время методов DBManager на синтетической БД')
+    parser.add_argument('--db', default='/tmp/cleanny_big.db')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--staff', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='Сохранить результаты как эталон')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='Допустимое отношение медианы к эталонной')
+    args = parser.parse_args()
+
+    prepare_db(args.db, args.users, args.orders, args.staff, args.seed)
+    work_path = args.db + '.run'
+    shutil.copyfile(args.db, work_path)
+
+    manager = DBManager(work_path)
+    results = {}
+    try:
+        # DBManager сообщает о каждом обновлении записи через print
+        with contextlib.redirect_stdout(io.StringIO()):
+            cases = db_cases(manager, args.users, args.orders, args.staff, random.Random(args.seed))
+            for name, func in cases.items():
+                results[name] = measure(func, args.repeat)
+    finally:
+        manager.close()
+        os.remove(work_path)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        baseline = saved['results']
+        if saved['environment'] != environment(args):
+            print(f'Эталон получен в других условиях: {saved["environment"]}')
+
+    regressions = []
+    print(f'{"Замер":<38}{"среднее, мс":>13}{"p50, мс":>10}{"p99, мс":>10}{"эталон p50":>12}{"отношение":>11}')
+    for name, timings in results.items():
+        line = f'{name:<38}{timings["mean"]:>13.3f}{timings["p50"]:>10.3f}{timings["p99"]:>10.3f}'
+        if name in baseline:
+            ratio = timings['p50'] / baseline[name]['p50'] if baseline[name]['p50'] else float('inf')
+            line += f'{baseline[name]["p50"]:>12.3f}{ratio:>10.2f}x'
+            if ratio > args.threshold:
+                regressions.append(name)
+                line += '  регрессия'
+        print(line)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'environment': environment(args), 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f'Эталон сохранен: {args.baseline}')
+    elif regressions:
+        print(f'Регрессии (медиана хуже эталонной больше чем в {args.threshold} раз): {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+Пропускная способность бота: воронка заказа воспроизводится для множества пользователей через
+`Dispatcher.feed_update` без сети. Запросы к Telegram обслуживает сессия-заглушка, Google таблицу - таблица-заглушка,
+данные хранятся в синтетической БД (см. `benchmarks.synthetic_db`).
+
+Воронка: /start → /calculate → комнаты/санузлы +/- → календарь → время → доп. услуги → регистрация → оплата →
+оформление заказа → принятие заказа сотрудником. Для каждого шага выводятся p50/p99 времени обработки,
+для всего прогона - количество заказов в секунду.
+
+Запуск: python -m benchmarks.bench_funnel --users 2000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import GetMe, SendMessage
+from aiogram.types import Chat, Message, Update, User
+from aiogram_calendar import SimpleCalendarCallback
+from aiogram_calendar.schemas import SimpleCalAct
+
+from callbacks import (
+    CalcCallback,
+    CalculateCallback,
+    PaymentCallback,
+    ServiceCallback,
+    StaffOrderCallback,
+    TimeCallback
+)
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Первый tg_id пользователей воронки (не пересекается с пользователями и сотрудниками синтетической БД)
+FUNNEL_TG_ID_BASE = 3 * 10 ** 9
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'cleanny_bot'}
+
+
+class StubSession(BaseSession):
+    """
+    Сессия бота без сети: sendMessage возвращает новое сообщение, getMe - бота, остальные методы - True.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.requests = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests[type(method).__name__] += 1
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.now(),
+                chat=Chat(id=int(method.chat_id), type='private'),
+                text=method.text
+            )
+        if isinstance(method, GetMe):
+            return User(**BOT_USER)
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self) -> None:
+        pass
+
+
+class StubWorksheet:
+    """
+    Лист с графиком работы: все сотрудники работают каждый день месяца.
+    """
+
+    def __init__(self, staff: list):
+        self.records = [
+            {'ФИО': f"{i['last_name']} {i['first_name']} {i['surname']}", **{str(d): 0 for d in range(1, 32)}}
+            for i in staff
+        ]
+        self.updated_cells = 0
+
+    def get_all_records(self) -> list:
+        return [dict(i) for i in self.records]
+
+    def find(self, value):
+        return None
+
+    def batch_update(self, data, **kwargs) -> None:
+        self.updated_cells += len(data)
+
+
+class StubSpreadsheet:
+    def __init__(self, worksheet: StubWorksheet):
+        self.worksheet = worksheet
+
+    def get_worksheet(self, index: int) -> StubWorksheet:
+        return self.worksheet
+
+
+class FunnelReplay:
+    """
+    Прогон воронки заказа: обновления Telegram подаются в диспетчер бота, время обработки каждого
+    обновления записывается по названию шага.
+    """
+
+    def __init__(self, bot_module, seed: int = 0):
+        self.module = bot_module
+        self.dp = bot_module.dp
+        self.bot = bot_module.bot
+        self.rnd = random.Random(seed)
+        self.timings = {}
+        self.unhandled = Counter()
+        self.errors = Counter()
+        self.outcomes = Counter()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _chat(self, tg_id: int) -> dict:
+        return {'id': tg_id, 'type': 'private'}
+
+    def _user(self, tg_id: int) -> dict:
+        return {'id': tg_id, 'is_bot': False, 'first_name': f'Пользователь{tg_id}'}
+
+    def message(self, tg_id: int, text: str) -> Update:
+        return Update.model_validate({
+            'update_id': next(self._update_ids),
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': self._chat(tg_id),
+                'from': self._user(tg_id),
+                'text': text
+            }
+        }, context={'bot': self.bot})
+
+    def callback(self, tg_id: int, data, message_id: int = None) -> Update:
+        return Update.model_validate({
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._update_ids)),
+                'from': self._user(tg_id),
+                'chat_instance': str(tg_id),
+                'message': {
+                    'message_id': message_id or next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': self._chat(tg_id),
+                    'from': BOT_USER,
+                    'text': '...'
+                },
+                'data': data if isinstance(data, str) else data.pack()
+            }
+        }, context={'bot': self.bot})
+
+    async def feed(self, step: str, update: Update) -> None:
+        started = time.perf_counter()
+        try:
+            result = await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.errors[step] += 1
+            raise
+        self.timings.setdefault(step, []).append((time.perf_counter() - started) * 1000)
+        if result is UNHANDLED:
+            self.unhandled[step] += 1
+
+    async def run_user(self, tg_id: int) -> None:
+        """
+        Проходит воронку от имени одного пользователя.
+        """
+
+        rnd = self.rnd
+        users_data = self.module.users_data
+
+        await self.feed('/start', self.message(tg_id, '/start'))
+        await self.feed('/calculate', self.message(tg_id, '/calculate'))
+        for item, change in (('room', 1), ('bathroom', 1), ('room', 1), ('room', -1)):
+            await self.feed('комнаты и санузлы', self.callback(tg_id, CalcCallback(item=item, change=change)))
+        await self.feed('расчет', self.callback(tg_id, CalculateCallback()))
+
+        day = datetime.now() + timedelta(days=rnd.randint(1, 89))
+        await self.feed('календарь', self.callback(
+            tg_id, SimpleCalendarCallback(act=SimpleCalAct.day, year=day.year, month=day.month, day=day.day)
+        ))
+
+        hours, minutes = self.module.TIME_PICKER_SLOTS[0]
+        await self.feed('время', self.callback(
+            tg_id, TimeCallback(action='hour', change=1, hours=hours, minutes=minutes)
+        ))
+        hours, minutes = rnd.choice(self.module.TIME_PICKER_SLOTS[:10])
+        await self.feed('время', self.callback(
+            tg_id, TimeCallback(action='ok', change=0, hours=hours, minutes=minutes)
+        ))
+
+        buttons = len(users_data[tg_id]['catalog'].additional_services_buttons)
+        for index in rnd.sample(range(buttons - 1), rnd.randint(0, 3)):
+            await self.feed('доп. услуги', self.callback(tg_id, ServiceCallback(index=index)))
+        await self.feed('доп. услуги', self.callback(tg_id, ServiceCallback(index=buttons - 1)))
+
+        for value in ('Имя', 'Фамилия', 'Отчество', f'Адрес {tg_id}', f'+375{tg_id % 10 ** 9:09d}',
+                      f'user{tg_id}@example.com'):
+            await self.feed('регистрация', self.message(tg_id, value))
+
+        await self.feed('подтверждение данных', self.callback(tg_id, 'confirm-udata'))
+        await self.feed('оплата', self.callback(tg_id, PaymentCallback(index=rnd.randrange(3))))
+        await self.feed('оформление', self.callback(tg_id, 'order-checkout'))
+
+        # Предложение заказа сотруднику хранится в AutoAssignJobs, передача заказа админам - там же с `escalated_at`
+        order_id = users_data[tg_id]['order']['id']
+        job = await self.module.async_db_manager.get_record('AutoAssignJobs', order_id=order_id)
+        if not job or job['escalated_at'] is not None:
+            self.outcomes['передан админам'] += 1
+            return
+        await self.feed('принятие сотрудником', self.callback(
+            job['chat_id'], StaffOrderCallback(order_id=order_id), message_id=job['msg_id']
+        ))
+        self.outcomes['принят сотрудником'] += 1
+
+    async def run(self, users: int, concurrency: int, first_tg_id: int = FUNNEL_TG_ID_BASE) -> float:
+        """
+        Проходит воронку от имени новых пользователей, не больше `concurrency` пользователей одновременно.
+
+        :return: Время прогона в секундах.
+        """
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_user(tg_id: int) -> None:
+            async with semaphore:
+                try:
+                    await self.run_user(tg_id)
+                except Exception:
+                    self.outcomes['ошибка'] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_user(first_tg_id + i) for i in range(users)))
+        return time.perf_counter() - started
+
+
+async def replay(args) -> None:
+    # Модуль бота читает настройки и подключается к БД при импорте, поэтому импортируется после подготовки каталога
+    import gspread
+    import bot as bot_module
+
+    worksheet = StubWorksheet(bot_module.db_manager.get_all_records('Staff'))
+    gspread.service_account = lambda **kwargs: type('Client', (), {
+        'open_by_key': staticmethod(lambda key: StubSpreadsheet(worksheet))
+    })()
+
+    session = StubSession()
+    bot_module.bot.session = session
+    await bot_module.sh.connect()
+    bot_module.build_keyboards()
+
+    funnel = FunnelReplay(bot_module, seed=args.seed)
+    try:
+        # DBManager сообщает о каждой записи через print
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Прогрев кэшей клавиатур, расчетов и графика, в результаты не входит
+            warmup = min(args.users, 10)
+            await funnel.run(warmup, args.concurrency)
+            funnel = FunnelReplay(bot_module, seed=args.seed)
+
+            elapsed = await funnel.run(args.users, args.concurrency, first_tg_id=FUNNEL_TG_ID_BASE + warmup)
+            await bot_module.sheets_writer.flush()
+    finally:
+        bot_module.async_db_manager.shutdown()
+        bot_module.db_manager.close()
+
+    print(f'{"Шаг":<24}{"обновлений":>12}{"p50, мс":>10}{"p99, мс":>10}{"без обработчика":>17}{"ошибок":>8}')
+    for step, timings in funnel.timings.items():
+        timings = np.array(timings)
+        print(f'{step:<24}{len(timings):>12}{np.percentile(timings, 50):>10.2f}{np.percentile(timings, 99):>10.2f}'
+              f'{funnel.unhandled[step]:>17}{funnel.errors[step]:>8}')
+
+    updates = sum(len(i) for i in funnel.timings.values())
+    bookings = funnel.outcomes['принят сотрудником'] + funnel.outcomes['передан админам']
+    print(f'\nПользователей: {args.users}, одновременно: {args.concurrency}, время: {elapsed:.2f} с')
+    print(f'Итоги воронки: {dict(funnel.outcomes)}')
+    print(f'Заказов в секунду: {bookings / elapsed:.1f}, обновлений в секунду: {updates / elapsed:.1f}')
+    print(f'Запросы к Bot API: {dict(session.requests)}')
+    print(f'Ячеек записано в Google таблицу: {worksheet.updated_cells}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Воспроизведение воронки заказа')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--db-users', type=int, default=5000)
+    parser.add_argument('--db-orders', type=int, default=50000)
+    parser.add_argument('--staff', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        print(f'Генерация БД: {args.db_users} пользователей, {args.db_orders} заказов...')
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.synthetic_db', path, '--users', str(args.db_users),
+             '--orders', str(args.db_orders), '--staff', str(args.staff), '--seed', str(args.seed), '--migrate'],
+            cwd=REPO_ROOT,
+            check=True
+        )
+
+        # Настройки бота для прогона: БД - синтетическая, сеть не используется
+        os.makedirs(os.path.join(tmp, 'resources'))
+        with open(os.path.join(tmp, 'resources', 'config.ini'), 'w') as f:
+            f.write(
+                '[Bot]\ntoken=123456:ABCdefGhIJKlmnoPQRstuVWXyz0123456789\nadmin_chat_id=-100\n'
+                f'[GS]\nkey=stub\n[DB]\npath={path}\n'
+            )
+
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        sys.path.insert(0, REPO_ROOT)
+        try:
+            asyncio.run(replay(args))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Сравнение времени частых запросов на синтетической БД до и после миграций с индексами.
+
+Запуск: python -m benchmarks.bench_indexes --users 20000 --orders 200000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.synthetic_db import USER_TG_ID_BASE, STAFF_TG_ID_BASE, build_synthetic_db
+
+
+ORDERS_HISTORY_QUERY = """
+    SELECT Orders.*, Staff.first_name, Staff.last_name, Staff.Surname
+    FROM Orders
+    JOIN Staff ON Orders.staff_id = Staff.id
+    WHERE Orders.user_id = ? AND Orders.status IN (?, ?)
+"""
+
+
+def hot_queries(manager, users: int, staff: int, rnd: random.Random) -> dict:
+    """
+    Запросы, которые бот выполняет на каждом шаге воронки, со случайными параметрами.
+    """
+
+    def staff_fio():
+        i = rnd.randrange(staff)
+        return manager.get_record('Staff', last_name=f'Фамилия{i}', first_name=f'Имя{i}', surname=f'Отчество{i}')
+
+    return {
+        'get_staff_data (Staff.tg_id)': lambda: manager.get_staff_data(STAFF_TG_ID_BASE + rnd.randrange(staff)),
+        'Staff по ФИО': staff_fio,
+        'get_order_frequency': lambda: manager.get_order_frequency(USER_TG_ID_BASE + rnd.randrange(users)),
+        '/orders': lambda: manager.fetch_all(
+            ORDERS_HISTORY_QUERY, (rnd.randint(1, users), 'Принят', 'Завершен')
+        ),
+        'OrdersServices.order_id': lambda: manager.get_records('OrdersServices', order_id=rnd.randint(1, 1000)),
+    }
+
+
+def measure(func, repeat: int) -> float:
+    """
+    :return: Среднее время одного вызова в миллисекундах.
+    """
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запросы без индексов и с индексами')
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--staff', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        print(f'Генерация БД: {args.users} пользователей, {args.orders} заказов...')
+        manager = build_synthetic_db(path, args.users, args.orders, args.staff)
+
+        results = {}
+        for stage in ('scan', 'index'):
+            if stage == 'index':
+                manager.migrate()
+            for name, func in hot_queries(manager, args.users, args.staff, random.Random(1)).items():
+                func()
+                results.setdefault(name, {})[stage] = measure(func, args.repeat)
+        manager.close()
+
+    print(f'{"Запрос":<32}{"без индексов, мс":>18}{"с индексами, мс":>18}{"ускорение":>12}')
+    for name, timings in results.items():
+        speedup = timings['scan'] / timings['index'] if timings['index'] else float('inf')
+        print(f'{name:<32}{timings["scan"]:>18.3f}{timings["index"]:>18.3f}{speedup:>11.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Сравнение расчета стоимости заказа: прежний расчет по словарю услуг, PricingEngine.quote (без кэша и с кэшем)
+и пакетный PricingEngine.quote_many.
+
+Запуск: python -m benchmarks.bench_pricing --configs 100000
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.synthetic_db import SERVICES
+from pricing import PricingEngine, to_minor
+
+
+def services_records() -> list:
+    return [
+        {'id': ind, 'name': name, 'lead_time': lead_time, 'price': price, 'additional_service': additional}
+        for ind, (name, lead_time, price, additional) in enumerate(SERVICES, start=1)
+    ]
+
+
+def legacy_quote(services_dict: dict, services_by_id: dict, rooms: int, bathrooms: int, services: tuple,
+                 discount: int) -> tuple:
+    """
+    Расчет в том виде, в котором он был разбросан по обработчикам: арифметика float по словарю услуг.
+    """
+
+    price = services_dict['1 Комната']['price'] + services_dict['1 Санузел']['price']
+    hours = float(services_dict['1 Комната']['lead_time']) + float(services_dict['1 Санузел']['lead_time'])
+    price += (rooms - 1) * services_dict['+1 Комната']['price'] + (bathrooms - 1) * services_dict['+1 Санузел']['price']
+    hours += (rooms - 1) * float(services_dict['+1 Комната']['lead_time'])
+    hours += (bathrooms - 1) * float(services_dict['+1 Санузел']['lead_time'])
+    for service_id in services:
+        price += services_by_id[service_id]['price']
+        hours += float(services_by_id[service_id]['lead_time'])
+    return price - price * discount / 100, hours
+
+
+def measure(func, repeat: int = 1) -> float:
+    """
+    :return: Время выполнения в миллисекундах.
+    """
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Расчет стоимости заказа')
+    parser.add_argument('--configs', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    records = services_records()
+    services_dict = {i['name']: i for i in records}
+    services_by_id = {i['id']: i for i in records}
+    engine = PricingEngine(records, cache_size=args.configs)
+
+    # Варианты заказов, которые реально встречаются в воронке: немного комнат, несколько услуг, типовые скидки
+    rnd = random.Random(args.seed)
+    additional = engine.additional
+    configs = [
+        (
+            rnd.randint(1, 6),
+            rnd.randint(1, 3),
+            tuple(rnd.sample(additional, rnd.randint(0, 3))),
+            rnd.choice((0, 3, 5, 10, 15))
+        )
+        for _ in range(args.configs)
+    ]
+    masks = [engine.mask(i[2]) for i in configs]
+
+    # Проверка совпадения результатов
+    for rooms, bathrooms, services, discount in configs[:1000]:
+        price, hours = legacy_quote(services_dict, services_by_id, rooms, bathrooms, services, discount)
+        quote = engine.quote(rooms, bathrooms, services, discount)
+        assert abs(to_minor(price) - quote.total_price) <= 1 and abs(hours * 60 - quote.minutes) < 1e-6
+    engine = PricingEngine(records, cache_size=args.configs)
+
+    results = {
+        'словарь услуг (прежний расчет)': measure(
+            lambda: [legacy_quote(services_dict, services_by_id, *i) for i in configs]
+        ),
+        'quote, первый расчет': measure(lambda: [engine.quote(*i) for i in configs]),
+        'quote, из кэша': measure(lambda: [engine.quote(*i) for i in configs]),
+        'quote_many': measure(lambda: engine.quote_many(
+            [i[0] for i in configs], [i[1] for i in configs], masks, [i[3] for i in configs]
+        )),
+    }
+
+    print(f'Вариантов заказа: {args.configs}, уникальных: {engine.stats["size"]}')
+    print(f'{"Способ":<34}{"всего, мс":>12}{"на вариант, мкс":>18}')
+    for name, elapsed in results.items():
+        print(f'{name:<34}{elapsed:>12.1f}{elapsed / args.configs * 1000:>18.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Генератор синтетической БД с реалистичным распределением данных для бенчмарков.
+
+Запуск: python -m benchmarks.synthetic_db /tmp/cleanny_big.db --users 100000 --orders 1000000
+"""
+
+import argparse
+import os
+import random
+import time
+
+from cleanny_db_manager import DBManager
+
+
+# Каталог услуг повторяет рабочую БД: базовые услуги, доплаты и дополнительные услуги
+SERVICES = [
+    ('1 Комната', 1.5, 30, 0),
+    ('Внутри холодильника', 1, 25, 1),
+    ('+1 Комната', 1, 14, 0),
+    ('+1 Санузел', 0.5, 20, 0),
+    ('1 Санузел', 1.5, 35, 0),
+    ('Уберем на балконе', 1, 20, 1),
+    ('Помоем окна', 0.5, 15, 1),
+    ('Погладим белье', 1, 20, 1),
+    ('Внутри микроволновки', 0.5, 20, 1),
+    ('Помоем посуду', 0.5, 10, 1),
+    ('Внутри кухонных шкафов', 1, 25, 1),
+    ('Внутри духовки', 1, 25, 1),
+]
+
+# Скидки: (размер скидки, частота заказов)
+DISCOUNTS = [(15, 4), (10, 2), (5, 1), (3, 0)]
+
+STATUSES = ('В обработке', 'Принят', 'Завершен')
+PAYMENTS = ('Картой по индивидуальной ссылке', 'Через интернет-банкинг', 'Наличными')
+
+# Первый tg_id синтетических пользователей и сотрудников
+USER_TG_ID_BASE = 10 ** 9
+STAFF_TG_ID_BASE = 5 * 10 ** 9
+
+
+def build_synthetic_db(path: str, users: int = 10000, orders: int = 100000, staff: int = 50,
+                       history_days: int = 365, seed: int = 0) -> DBManager:
+    """
+    Создает новую БД по схеме `DBManager.create_db` и наполняет ее синтетическими данными.
+    Миграции не применяются, чтобы можно было сравнить запросы без индексов и с индексами.
+
+    :param path: Путь к файлу БД (существующий файл будет удален).
+    :param users: Количество пользователей.
+    :param orders: Количество заказов.
+    :param staff: Количество сотрудников.
+    :param history_days: Глубина истории заказов в днях.
+    :param seed: Начальное значение генератора случайных чисел.
+    :return: DBManager, подключенный к созданной БД.
+    """
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    rnd = random.Random(seed)
+    manager = DBManager(path)
+    manager.create_db()
+    now = int(time.time())
+
+    with manager.con as con:
+        con.executemany(
+            'INSERT INTO Services (name, lead_time, price, additional_service) VALUES (?, ?, ?, ?)',
+            SERVICES
+        )
+        con.executemany('INSERT INTO Discounts (discount_value, orders_frequency) VALUES (?, ?)', DISCOUNTS)
+        con.executemany(
+            'INSERT INTO Staff (tg_id, first_name, last_name, surname, is_admin) VALUES (?, ?, ?, ?, ?)',
+            (
+                (STAFF_TG_ID_BASE + i, f'Имя{i}', f'Фамилия{i}', f'Отчество{i}', int(i == 0))
+                for i in range(staff)
+            )
+        )
+        con.executemany(
+            'INSERT INTO Users (tg_id, first_name, last_name, surname, address, phone, email) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                (USER_TG_ID_BASE + i, f'Имя{i}', f'Фамилия{i}', f'Отчество{i}', f'Адрес {i}',
+                 f'+375{i:09d}', f'user{i}@example.com')
+                for i in range(users)
+            )
+        )
+
+        # Небольшая доля постоянных клиентов делает большую часть заказов
+        weights = [1 / (i + 1) ** 0.8 for i in range(users)]
+
+        def order_rows():
+            user_ids = rnd.choices(range(1, users + 1), weights=weights, k=orders)
+            for user_id in user_ids:
+                order_date = now - rnd.randint(0, history_days * 86400)
+                status = rnd.choice(STATUSES)
+                yield (
+                    order_date + rnd.randint(1, 90) * 86400,
+                    rnd.randint(65, 400),
+                    rnd.choice((3.0, 3.5, 4.0, 5.0, 6.5)),
+                    status,
+                    f'Адрес {user_id}',
+                    rnd.choice(PAYMENTS),
+                    order_date,
+                    user_id,
+                    # Заказ в обработке еще не назначен сотруднику, скидка есть примерно у трети заказов
+                    rnd.randint(1, staff) if status != 'В обработке' else None,
+                    rnd.randint(1, len(DISCOUNTS)) if rnd.random() < 0.3 else None
+                )
+
+        con.executemany(
+            'INSERT INTO Orders (appointment_datetime, total_price, total_time, status, address, payment, '
+            'order_date, user_id, staff_id, discount_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            order_rows()
+        )
+
+        def orders_services_rows():
+            for order_id in range(1, orders + 1):
+                # Базовые услуги есть в каждом заказе, плюс доп. комнаты/санузлы и случайные дополнительные услуги
+                yield 1, order_id, 1
+                yield 1, order_id, 5
+                if rnd.random() < 0.5:
+                    yield rnd.randint(1, 3), order_id, 3
+                if rnd.random() < 0.2:
+                    yield 1, order_id, 4
+                for service_id in rnd.sample((2, 6, 7, 8, 9, 10, 11, 12), rnd.randint(0, 2)):
+                    yield 1, order_id, service_id
+
+        con.executemany(
+            'INSERT INTO OrdersServices (quantity_services, order_id, service_id) VALUES (?, ?, ?)',
+            orders_services_rows()
+        )
+
+    return manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерация синтетической БД')
+    parser.add_argument('path')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--staff', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--migrate', action='store_true', help='Применить миграции после генерации')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    manager = build_synthetic_db(args.path, args.users, args.orders, args.staff, seed=args.seed)
+    if args.migrate:
+        manager.migrate()
+    manager.close()
+    print(f'{args.path}: {args.users} пользователей, {args.orders} заказов, '
+          f'{time.perf_counter() - started:.1f} с')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,31 @@ import logging
 import asyncio
 import sys
 import gspread
-import random
 
 import aiogram.exceptions
 from aiogram.filters.callback_data import CallbackData
 
-from cleanny_db_manager import db_manager
+from cleanny_db_manager import db_manager, async_db_manager
+from discounts import discount_index
+from sheets_manager import LazySpreadsheet, ScheduleCache, SheetsWriter
+from staff_assignment import AssignmentEngine
+from sessions import SessionStore, SessionStorage
+from webhook import run_webhook
+from outbound import OutboundDispatcher, PRIORITY_HIGH, PRIORITY_LOW, priority
+from notifications import Notifier
+from keyboards import cached_keyboard, keyboard_stats
+from pricing import ROOM, BATHROOM, EXTRA_ROOM, EXTRA_BATHROOM, to_major
+from catalog import services_catalog
+from startup import Startup
+from callbacks import (
+    CalcCallback,
+    CalculateCallback,
+    OrdersPageCallback,
+    PaymentCallback,
+    ServiceCallback,
+    StaffOrderCallback,
+    TimeCallback
+)
 from resources import text
 
 from aiogram.client.default import DefaultBotProperties
@@ -28,6 +47,7 @@ from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
 
 import configparser
 from datetime import datetime, timedelta
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 
@@ -38,160 +58,419 @@ config.read('resources/config.ini')
 # Получение значений из раздела Bot
 tg_token = config['Bot']['token']
 admin_chat_id = config['Bot']['admin_chat_id']
+# Сколько ждать загрузки графика работы, прежде чем отдать заказ, оформленный без графика, админу
+schedule_wait_timeout = config.getfloat('Bot', 'schedule_wait_timeout', fallback=600)
 
-# Словарь для хранения данных о пользователях
-users_data = {}
+def load_session(user_id: int) -> dict:
+    """
+    Начальные данные новой сессии пользователя: профиль из кэша, если пользователь зарегистрирован.
+
+    :param user_id: Телеграм id пользователя.
+    :return: Словарь с полями сессии.
+    """
+
+    user = db_manager.user_profiles.get(user_id)
+    return {'user': user} if user else {}
+
+
+# Сессии пользователей (данные диалога), неактивные сессии удаляются
+users_data = SessionStore(
+    ttl=config.getfloat('Bot', 'session_ttl', fallback=3600),
+    max_sessions=config.getint('Bot', 'max_sessions', fallback=10000),
+    loader=load_session
+)
 
-# Получение данных и наполнения словаря `users_data`
-users = db_manager.get_all_records('Users')
-if users:
-    for user in users:
-        tg_id = user['tg_id']
-        users_data[tg_id] = {
-            'user': dict(user)
-        }
 
-# Вложенный словарь с данными услуг
-services_dt = db_manager.get_all_records('Services')
-services_dict = {dict(i)['name']: dict(i) for i in services_dt}
 
-# Google sheets
-gc = gspread.service_account(filename='resources/true-sprite-405907-da4b97639184.json')
-sh = gc.open_by_key(config['GS']['key'])
+def open_spreadsheet() -> gspread.Spreadsheet:
+    gc = gspread.service_account(filename='resources/true-sprite-405907-da4b97639184.json')
+    return gc.open_by_key(config['GS']['key'])
+
+
+# Google sheets: таблица открывается в фоне после запуска бота
+sh = LazySpreadsheet(open_spreadsheet, retry_interval=config.getfloat('GS', 'connect_retry_interval', fallback=5))
+
+# Кэш графика работы сотрудников и фоновая запись изменений в Google таблицу
+schedule_cache = ScheduleCache(sh, worksheet=0, ttl=config.getfloat('GS', 'schedule_ttl', fallback=60))
+sheets_writer = SheetsWriter(
+    sh,
+    flush_interval=config.getfloat('GS', 'flush_interval', fallback=5),
+    schedule_cache=schedule_cache
+)
+
+# Распределение заказов между сотрудниками
+assignment_engine = AssignmentEngine()
 
 # Диспетчер, бот
-dp = Dispatcher()
+dp = Dispatcher(storage=SessionStorage(users_data))
 bot = Bot(token=tg_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 
+# Очередь исходящих сообщений с учетом лимитов Telegram
+outbound = OutboundDispatcher(
+    global_rate=config.getfloat('Bot', 'global_rate', fallback=30),
+    chat_rate=config.getfloat('Bot', 'chat_rate', fallback=1)
+)
+bot.session.middleware(outbound)
+
+# Рассылка оповещений о заказе нескольким получателям
+notifier = Notifier()
+
 
 # Планировщик
 scheduler = AsyncIOScheduler()
 
+# Фоновая инициализация после запуска диспетчера
+startup = Startup()
+
+
+@dp.update.outer_middleware()
+async def catalog_middleware(handler, event, data):
+    """
+    Загружает каталог услуг до обработки обновления, если этап запуска 'catalog' еще не завершился.
+    Загрузка выполняется в пуле потоков БД, а не синхронно в обработчике (`services_catalog.current`).
+    """
+
+    if not services_catalog.loaded:
+        await async_db_manager.run(services_catalog.load)
+    return await handler(event, data)
+
+
+@dp.update.outer_middleware()
+async def user_profile_middleware(handler, event, data):
+    """
+    Загружает профиль пользователя в сессию при первом обращении (из кэша или из БД).
+    """
+
+    user = data.get('event_from_user')
+    if user and 'user' not in users_data.get(user.id, {}):
+        profile = await async_db_manager.get_user(user.id)
+        if profile:
+            users_data[user.id]['user'] = profile
+    return await handler(event, data)
+
 
 # функции
-def is_same_month(unix_timestamp: int) -> bool:
+async def book_staff_hours(fio: str, appointment_datetime: float, total_time: float, row: int = None) -> None:
+    """
+    Бронирует часы заказа (вместе с часом дороги) сотруднику и ставит их в гугл таблицу.
+
+    :param fio: ФИО сотрудника.
+    :param appointment_datetime: Дата и время заказа в формате Unix.
+    :param total_time: Время выполнения заказа.
+    :param row: Номер строки сотрудника в гугл таблице, если известен.
+    :return: None
+    """
+
+    when = datetime.fromtimestamp(appointment_datetime)
+    hours = assignment_engine.book(fio, when, total_time + 1)
+    if hours is None:
+        # Сотрудника или дня нет в графике: итог дня неизвестен, часы одного заказа в ячейку не пишем
+        logging.warning('Часы заказа не поставлены в график: %s, %s', fio, when.strftime('%Y.%m.%d'))
+        return
+
+    # В гугл таблице только дни текущего месяца
+    now = datetime.now()
+    if (when.year, when.month) == (now.year, now.month):
+        sheets_writer.update_cell(0, row or fio, when.day + 1, hours)
+
+
+def standard_price(pricing, room: int, bathroom: int) -> int or float:
     """
-    Проверяет, относится ли дата в формате Unix к текущему месяцу.
+    Стандартная стоимость заказа для сообщений о заказе: комнаты и санузлы без дополнительных услуг и скидки.
 
-    :param unix_timestamp: Дата в формате Unix
-    :return: True, если дата относится к текущему месяцу, и False в противном случае
+    :param pricing: Расчет стоимости по каталогу услуг (`pricing.PricingEngine`).
+    :param room: Количество комнат.
+    :param bathroom: Количество санузлов.
+    :return: Стоимость в рублях.
     """
-    date = datetime.fromtimestamp(unix_timestamp)
 
-    # Получаем текущий месяц и год
-    current_month = datetime.utcnow().month
-    current_year = datetime.utcnow().year
+    return to_major(pricing.quote(room, bathroom).base_price)
 
-    # Получаем месяц и год для заданной даты
-    given_month = date.month
-    given_year = date.year
 
-    return given_month == current_month and given_year == current_year
+def get_order_info(order: dict) -> dict:
+    """
+    Формирует данные для сообщений о заказе (`text.ORDER_MSG`) из записи, полученной `get_order_details`.
 
+    :param order: Заказ с услугами, скидкой и сотрудником.
+    :return: Словарь с данными заказа.
+    """
 
-def sum_values_of_current_week(dicty: dict) -> int:
+    quantity = {i['name']: i['quantity_services'] for i in order['services']}
+    additional = [i for i in order['services'] if i['additional_service']]
+    room = 1 + quantity.get(EXTRA_ROOM, 0)
+    bathroom = 1 + quantity.get(EXTRA_BATHROOM, 0)
+
+    order_info = dict(order)
+    order_info.update(
+        room=room,
+        bathroom=bathroom,
+        services='\n'.join(f'{i["name"]} - {i["price"]} р' for i in additional),
+        price=standard_price(services_catalog.current.pricing, room, bathroom),
+        discount=order['discount_value'] or 0,
+        appointment_datetime=datetime.fromtimestamp(order['appointment_datetime']).strftime("%d.%m.%Y %H:%M"),
+        order_date=datetime.fromtimestamp(int(order['order_date'])).strftime("%d.%m.%Y")
+    )
+    if order['staff_last_name']:
+        order_info['employee_fio'] = f"{order['staff_last_name']} {order['staff_first_name']} {order['staff_surname']}"
+    else:
+        order_info['employee_fio'] = 'Сотрудник не выбран'
+    return order_info
+
+
+def schedule_auto_assign(job: dict) -> None:
     """
-    Получение суммы отработанных часов текущей недели.
+    Добавляет в планировщик задачу автоматического распределения заказа.
 
-    :param dicty: Словарь, где ключи - даты, значения - отработанные часы.
-    :return: Сумма отработанных часов текущей недели.
+    :param job: Запись из таблицы `AutoAssignJobs`.
+    :return: None
     """
 
-    current_date = datetime.now()
+    scheduler.add_job(
+        auto_assign_orders,
+        'date',
+        run_date=datetime.fromtimestamp(job['run_at']),
+        kwargs={'job_id': job['id']},
+        id=f'auto-assign-{job["order_id"]}',
+        replace_existing=True,
+        misfire_grace_time=None
+    )
 
-    # Получение номера текущей недели
-    current_week_number = current_date.isocalendar()[1]
 
-    # Получение первого и последнего дня текущей недели
-    start_of_week = current_date - timedelta(days=current_date.weekday())
-    end_of_week = start_of_week + timedelta(days=6)
+async def remove_auto_assign(order_id: int) -> None:
+    """
+    Удаляет задачи автоматического распределения заказа из планировщика и из БД.
 
-    total_sum = 0
+    :param order_id: Номер заказа.
+    :return: None
+    """
 
-    for key in dicty:
-        # Если ключ представляет собой число, и оно принадлежит текущей неделе
-        if key.isdigit() and start_of_week.day <= int(key) <= end_of_week.day and isinstance(dicty[key], int):
-            total_sum += dicty[key]
+    try:
+        scheduler.remove_job(f'auto-assign-{order_id}')
+    except JobLookupError:
+        pass
+    await async_db_manager.delete_records('AutoAssignJobs', order_id=order_id)
 
-    return total_sum
 
+def fits_working_day(order_datetime: datetime, execution_time: float) -> bool:
+    """
+    Проверяет, вписывается ли выполнение заказа в рабочий день (до 21:00).
 
-async def auto_assign_orders(**kwargs) -> None:
+    :param order_datetime: Дата и время заказа.
+    :param execution_time: Время выполнения заказа вместе с часом дороги.
+    :return: True, если заказ заканчивается не позже 21:00.
     """
-    Функция для автоматического распределения заказа, в случае, если персонал не принимает заказ в течение часа.
 
-    :param kwargs: Словарь с парами ключ - значение: 'staff': список сотрудников,
-    'id': номер заказа,
-    'msg_id': message_id,
-    'chat_id': идентификатор сотрудника которому было отправлено сообщение,
-    'user_id': идентификатор пользователя Telegram
+    end = order_datetime + timedelta(hours=execution_time)
+    return end.date() == order_datetime.date() and end.time() <= datetime.strptime('21:00', '%H:%M').time()
+
+
+async def escalate_order(order_id: int, msg_txt: str) -> None:
+    """
+    Отдает заказ админу. Передача сохраняется в AutoAssignJobs (`escalated_at`), чтобы после перезапуска
+    заказ не распределялся автоматически и не отправлялся админу повторно.
+
+    :param order_id: Номер заказа.
+    :param msg_txt: Сообщение о заказе.
     :return: None
     """
 
-    msg_id = int(kwargs['msg_id'])
-    staff_list = kwargs['staff']
-    order_number = kwargs['id']
-    chat_id = kwargs['chat_id']
-    user_id = kwargs['user_id']
+    await remove_auto_assign(order_id)
+    now = int(datetime.now().timestamp())
+    await async_db_manager.insert_record('AutoAssignJobs', order_id=order_id, run_at=now, escalated_at=now)
+    await bot.send_message(chat_id=admin_chat_id, text=msg_txt)
+
+
+async def accept_order(order_id: int, employee_rec: dict) -> dict or None:
+    """
+    Назначает заказ сотруднику: меняет статус заказа, бронирует часы сотрудника и снимает задачу
+    автоматического распределения.
+
+    :param order_id: Номер заказа.
+    :param employee_rec: Запись о сотруднике из таблицы Staff.
+    :return: Данные для сообщения о заказе или None, если заказ не был обновлен (в том числе если его уже
+    распределили).
+    """
+
+    rec = await async_db_manager.assign_order(order_id, employee_rec['id'], 'Принят', 'В обработке')
+    if not rec:
+        return None
+
+    await remove_auto_assign(order_id)
 
-    # Удаляем сообщение о заказе так как оно не было принято
-    await bot.delete_message(
-        chat_id=chat_id,
-        message_id=msg_id
+    # Ставим часы сотруднику в гугл таблице по актуальному графику (после перезапуска матрица еще не построена)
+    await assignment_engine.refresh(schedule_cache, async_db_manager)
+    fio = f"{employee_rec['last_name']} {employee_rec['first_name']} {employee_rec['surname']}"
+    await book_staff_hours(
+        fio,
+        rec['appointment_datetime'],
+        rec['total_time'],
+        row=schedule_cache.row_of_staff(employee_rec)
     )
 
-    # Распределяем заказ
+    return get_order_info(await async_db_manager.get_order_details(order_id))
 
-    # Получаем сотрудника из списка сотрудников
-    employee = random.choice(staff_list)
-    fio = employee['ФИО']
 
-    # Ставим часы сотруднику в гугл таблице
-    wsh = sh.get_worksheet(0)
-    row = wsh.find(fio).row
-    col = datetime.fromtimestamp(users_data[user_id]['order']['appointment_datetime']).day + 1
-    wsh.update_cell(row, col, users_data[user_id]['order']['total_time'] + 1)
+async def auto_assign_orders(job_id: int) -> None:
+    """
+    Функция для автоматического распределения заказа, в случае, если персонал не принимает заказ в течение часа.
 
-    fio = fio.split(' ')
+    :param job_id: Идентификатор записи в таблице `AutoAssignJobs` (номер заказа, сообщение с предложением
+    и идентификатор сотрудника, которому оно было отправлено).
+    :return: None
+    """
 
-    # Получаем запись о сотруднике из БД
-    employee_rec = db_manager.get_record('Staff', last_name=fio[0], first_name=fio[1], surname=fio[2])
+    job = await async_db_manager.get_record('AutoAssignJobs', id=job_id)
+    if not job:
+        return
 
-    fio = " ".join(fio)
-    users_data[user_id]['order_info'].update(employee_fio=fio)
+    # Заказ мог быть принят или отменен, пока задача ждала выполнения
+    order = await async_db_manager.get_order_details(job['order_id'])
+    if not order or order['status'] != 'В обработке':
+        await async_db_manager.delete_records('AutoAssignJobs', id=job_id)
+        return
 
-    # Обновляем заказ в БД добавляя сотрудника и меняя статус
-    order = db_manager.update_record('Orders', order_number, staff_id=employee_rec['id'], status='Принят')
-    users_data[user_id]['order'] = order
+    # Удаляем сообщение о заказе так как оно не было принято (у восстановленных задач сообщения нет)
+    if job['msg_id']:
+        try:
+            await bot.delete_message(
+                chat_id=job['chat_id'],
+                message_id=job['msg_id']
+            )
+        except aiogram.exceptions.TelegramBadRequest:
+            pass
 
-    # Добавляем staff_id в заказ
-    users_data[kwargs['user_id']]['order']['staff_id'] = employee_rec['tg_id']
+    # Распределяем заказ
 
-    users_data[user_id]['order_info'].update(users_data[user_id]['order'])
+    # Выбираем наименее загруженного сотрудника, кроме того, кто не ответил на предложение.
+    # Если других подходящих сотрудников нет, заказ остается за ним.
+    # Заказ, который не вписывается в рабочий день, отдается админу
+    order_datetime = datetime.fromtimestamp(order['appointment_datetime'])
+    execution_time = order['total_time'] + 1
+    fio = None
+    if fits_working_day(order_datetime, execution_time):
+        declined = await async_db_manager.get_staff_data(job['chat_id']) if job['chat_id'] else None
+        declined_fio = f"{declined['last_name']} {declined['first_name']} {declined['surname']}" if declined else None
+        await assignment_engine.refresh(schedule_cache, async_db_manager)
+        fio = assignment_engine.choose(order_datetime, execution_time, exclude=(declined_fio, )) or declined_fio
+
+    employee_rec = None
+    if fio:
+        # Получаем запись о сотруднике из БД
+        last_name, first_name, surname = fio.split(' ')
+        employee_rec = await async_db_manager.get_record(
+            'Staff', last_name=last_name, first_name=first_name, surname=surname
+        )
 
-    order_info = users_data[user_id]['order_info']
-    order_info['appointment_datetime'] = datetime.fromtimestamp(order_info['appointment_datetime']).strftime("%d.%m.%Y %H:%M")
-    order_info['order_date'] = datetime.fromtimestamp(order_info['order_date']).strftime("%d.%m.%Y")
+    order_info = await accept_order(order['id'], employee_rec) if employee_rec else None
+    if not order_info:
+        # Заказ успел принять сотрудник или его отменили
+        order = await async_db_manager.get_order_details(order['id'])
+        if not order or order['status'] != 'В обработке':
+            await remove_auto_assign(job['order_id'])
+            return
+
+        # Не удалось назначить сотрудника, отдаем заказ админу
+        await escalate_order(order['id'], text.ORDER_MSG.format(**get_order_info(order)))
+        return
 
     # Отправляем оповещение о заказе сотруднику, админам и пользователю
-    await bot.send_message(
-        chat_id=employee_rec['tg_id'],
-        text=text.ORDER_MSG.format(**order_info)
+    msg_txt = text.ORDER_MSG.format(**order_info)
+    await notifier.notify(
+        {
+            'employee': lambda: bot.send_message(chat_id=employee_rec['tg_id'], text=msg_txt),
+            'admin': lambda: bot.send_message(chat_id=admin_chat_id, text=msg_txt),
+            'customer': lambda: bot.send_message(chat_id=order_info['user_tg_id'], text=msg_txt)
+        },
+        priorities={'admin': PRIORITY_LOW}
     )
 
-    await bot.send_message(
-        chat_id=admin_chat_id,
-        text=text.ORDER_MSG.format(**order_info)
-    )
 
-    await bot.send_message(
-        chat_id=user_id,
-        text=text.ORDER_MSG.format(**order_info)
-    )
+async def load_catalog() -> None:
+    await async_db_manager.run(services_catalog.load)
+
+
+async def wait_for_schedule() -> bool:
+    """
+    Ждет загрузки графика работы (этап запуска 'schedule') не дольше `schedule_wait_timeout` секунд.
+
+    :return: True, если график загружен.
+    """
+
+    try:
+        loaded = await asyncio.wait_for(startup.wait('schedule'), timeout=schedule_wait_timeout)
+    except asyncio.TimeoutError:
+        loaded = False
+    if not loaded:
+        logging.warning('График работы не загружен, заказы распределяются без него (отдаются админу)')
+    return loaded
+
+
+async def auto_assign_after_schedule(job_id: int) -> None:
+    """
+    Распределяет заказ, оформленный до загрузки графика работы (Google таблица еще не открыта), когда график
+    загрузится. Если график не загрузился за `schedule_wait_timeout` секунд, заказ распределяется без него,
+    то есть отдается админу.
+
+    :param job_id: Идентификатор записи в таблице `AutoAssignJobs`.
+    :return: None
+    """
+
+    await wait_for_schedule()
+    await auto_assign_orders(job_id)
+
+
+async def evict_idle_sessions() -> None:
+    """
+    Удаляет неактивные сессии. Корутина, чтобы планировщик выполнял ее в цикле событий, а не в отдельном потоке:
+    `SessionStore` не защищен блокировкой и используется обработчиками.
+
+    :return: None
+    """
+
+    users_data.evict_idle()
+
+
+async def restore_auto_assign_jobs() -> None:
+    """
+    Восстанавливает задачи автоматического распределения после перезапуска: будущие задачи возвращаются
+    в планировщик, а заказы, время ожидания которых уже истекло, распределяются сразу. Заказы в обработке,
+    для которых задача не была сохранена, тоже распределяются сразу.
+
+    :return: None
+    """
+
+    now = datetime.now().timestamp()
+    overdue = []
+    for job in await async_db_manager.get_all_records('AutoAssignJobs'):
+        if job['escalated_at'] is not None:
+            # Заказ уже передан админу
+            continue
+        if job['run_at'] <= now:
+            overdue.append(job['id'])
+        else:
+            schedule_auto_assign(dict(job))
+
+    for order in await async_db_manager.get_unassigned_orders('В обработке', now):
+        job = await async_db_manager.insert_record('AutoAssignJobs', order_id=order['id'], run_at=int(now))
+        if job:
+            overdue.append(job['id'])
+
+    if overdue:
+        logging.info('Распределение просроченных заказов: %s', len(overdue))
+        # Для выбора сотрудников нужен график из Google таблицы (при запуске она открывается в фоне).
+        # Если он не загрузился вовремя, заказы распределяются без него
+        await wait_for_schedule()
+        await assignment_engine.refresh(schedule_cache, async_db_manager)
+        for job_id in overdue:
+            try:
+                await auto_assign_orders(job_id)
+            except Exception:
+                logging.exception('Ошибка при распределении заказа (задача %s)', job_id)
 
 
 # kb
-def create_calculate_ikb(price: int, time: float, rooms=1, bathrooms=1) -> InlineKeyboardMarkup:
+@cached_keyboard(maxsize=256)
+def create_calculate_ikb(rooms=1, bathrooms=1) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     rooms_dict = {
         1: 'Комната',
@@ -209,38 +488,43 @@ def create_calculate_ikb(price: int, time: float, rooms=1, bathrooms=1) -> Inlin
     bathroom_txt = bathrooms_dict.get(bathrooms, 'Санузлов')
 
     builder.row(
-        InlineKeyboardButton(text='-', callback_data=f'minus-room_{rooms}_{bathrooms}_{price}_{time}'),
+        InlineKeyboardButton(text='-', callback_data=CalcCallback(item='room', change=-1).pack()),
         InlineKeyboardButton(text=f'{rooms} {room_txt}', callback_data='room'),
-        InlineKeyboardButton(text=f'+', callback_data=f'plus-room_{rooms}_{bathrooms}_{price}_{time}'),
+        InlineKeyboardButton(text=f'+', callback_data=CalcCallback(item='room', change=1).pack()),
     )
     builder.row(
-        InlineKeyboardButton(text='-', callback_data=f'minus-bathroom_{rooms}_{bathrooms}_{price}_{time}'),
+        InlineKeyboardButton(text='-', callback_data=CalcCallback(item='bathroom', change=-1).pack()),
         InlineKeyboardButton(text=f'{bathrooms} {bathroom_txt}', callback_data='bathroom'),
-        InlineKeyboardButton(text=f'+', callback_data=f'plus-bathroom_{rooms}_{bathrooms}_{price}_{time}')
+        InlineKeyboardButton(text=f'+', callback_data=CalcCallback(item='bathroom', change=1).pack())
     )
     builder.row(
-        InlineKeyboardButton(text='Рассчитать уборку', callback_data=f'calculate-cleaning_{price}_{time}')
+        InlineKeyboardButton(text='Рассчитать уборку', callback_data=CalculateCallback().pack())
     )
 
     return builder.as_markup()
 
 
+# Время уборки выбирается с 09:00 до 18:00 с шагом 30 минут
+TIME_PICKER_SLOTS = tuple((h, m) for h in range(9, 19) for m in (0, 30) if (h, m) <= (18, 0))
+
+
+@cached_keyboard(maxsize=len(TIME_PICKER_SLOTS))
 def create_time_ikb(hours=9, minutes=0) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.row(
-        InlineKeyboardButton(text='↑', callback_data=f'plus-hour_{hours}_{minutes}'),
-        InlineKeyboardButton(text='↑', callback_data=f'plus-minute_{hours}_{minutes}')
+        InlineKeyboardButton(text='↑', callback_data=TimeCallback(action='hour', change=1, hours=hours, minutes=minutes).pack()),
+        InlineKeyboardButton(text='↑', callback_data=TimeCallback(action='minute', change=1, hours=hours, minutes=minutes).pack())
     )
     builder.row(
         InlineKeyboardButton(text=f'0{hours}' if hours < 10 else str(hours), callback_data='hours'),
         InlineKeyboardButton(text=f'0{minutes}' if minutes < 10 else str(minutes), callback_data='minutes')
     )
     builder.row(
-        InlineKeyboardButton(text='↓', callback_data=f'minus-hour_{hours}_{minutes}'),
-        InlineKeyboardButton(text='↓', callback_data=f'minus-minute_{hours}_{minutes}')
+        InlineKeyboardButton(text='↓', callback_data=TimeCallback(action='hour', change=-1, hours=hours, minutes=minutes).pack()),
+        InlineKeyboardButton(text='↓', callback_data=TimeCallback(action='minute', change=-1, hours=hours, minutes=minutes).pack())
     )
     builder.row(
-        InlineKeyboardButton(text='Подтвердить', callback_data=f'confirm-time_{hours}_{minutes}')
+        InlineKeyboardButton(text='Подтвердить', callback_data=TimeCallback(action='ok', change=0, hours=hours, minutes=minutes).pack())
     )
 
     return builder.as_markup()
@@ -254,6 +538,30 @@ def create_ikb(buttons: dict, callback_prefix=None) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
+def session_catalog(session):
+    """
+    :param session: Сессия пользователя.
+    :return: Версия каталога услуг, с которой пользователь начал оформление заказа, либо текущая.
+    """
+
+    return session.get('catalog') or services_catalog.current
+
+
+def calculate_quote(session, discount: int = 0):
+    """
+    Рассчитывает стоимость заказа по данным сессии пользователя: количеству комнат и санузлов
+    и выбранным дополнительным услугам.
+
+    :param session: Сессия пользователя.
+    :param discount: Скидка в процентах.
+    :return: Расчет стоимости (`pricing.Quote`).
+    """
+
+    order_detail = session['order_detail']
+    pricing = session_catalog(session).pricing
+    return pricing.quote(order_detail['room'], order_detail['bathroom'], session.get('services', ()), discount)
+
+
 def dict_clear(user_id: int) -> None:
     if users_data.get(user_id):
         user_dt = users_data[user_id].get('user')
@@ -262,14 +570,29 @@ def dict_clear(user_id: int) -> None:
             users_data[user_id]['user'] = user_dt
 
 
-# Cоздание списка с именами услуг
-additional_services = [i for i in services_dt if i['additional_service']]
-additional_services_buttons = ['➖' + tuple(i)[1] for i in additional_services]
-additional_services_buttons.append('Подтвердить')
-additional_services_buttons = dict(enumerate(additional_services_buttons))
+@cached_keyboard(maxsize=256)
+def create_services_ikb(catalog, selected: int = 0) -> InlineKeyboardMarkup:
+    """
+    Клавиатура дополнительных услуг с отметками выбранных. Клавиатуры прежних версий каталога
+    вытесняются из кэша сами.
+
+    :param catalog: Версия каталога услуг (`catalog.CatalogSnapshot`).
+    :param selected: Битовая маска выбранных услуг (бит i - услуга с индексом i).
+    :return: Клавиатура.
+    """
 
-# Клавиатура услуг
-additional_services_ikb = create_ikb(additional_services_buttons, callback_prefix='additional-service')
+    btns = catalog.additional_services_buttons.copy()
+    for i in btns:
+        if selected >> i & 1:
+            btns[i] = '✅' + btns[i][1:]
+    return create_ikb({ServiceCallback(index=i).pack(): btn for i, btn in btns.items()})
+
+
+def build_keyboards() -> None:
+    # Клавиатура услуг текущей версии каталога и все клавиатуры выбора времени строятся заранее
+    create_services_ikb(services_catalog.current)
+    for slot in TIME_PICKER_SLOTS:
+        create_time_ikb(*slot)
 
 # Клавиатура для подтверждения/изменения данных пользователя
 udata_confirm_ikb = create_ikb(
@@ -287,8 +610,7 @@ udata_confirm_ikb = create_ikb(
 # Клавиатура для выбора способа оплаты
 payment_list = ['Картой по индивидуальной ссылке', 'Через интернет-банкинг', 'Наличными']
 payment_ikb = create_ikb(
-    buttons=dict(enumerate(payment_list)),
-    callback_prefix='payment',
+    buttons={PaymentCallback(index=i).pack(): payment for i, payment in enumerate(payment_list)}
 )
 
 # Клавиатура для подтверждения заказа
@@ -315,9 +637,10 @@ async def cmd_start_handler(msg: Message) -> None:
     user_id = msg.from_user.id
     dict_clear(user_id)
     kb = None
-    staff_data = db_manager.get_staff_data(user_id)
-    if staff_data['is_admin']:
-        users_data[user_id]['user']['is_admin'] = True
+    staff_data = await async_db_manager.get_staff_data(user_id)
+    if staff_data and staff_data['is_admin']:
+        if users_data[user_id].get('user'):
+            users_data[user_id]['user']['is_admin'] = True
         kb = admin_kb
     await msg.answer(text=text.WELCOME_USER_MSG.format(
         facebook=html.link('FaceBook', 'https://www.facebook.com/cleanny.happy.home/'),
@@ -335,13 +658,17 @@ async def cmd_calculate_handler(msg: Message) -> None:
     # Базовое количество комнат и санузлов
     order_detail = {'room': 1, 'bathroom': 1}
 
+    # Заказ оформляется по текущей версии каталога услуг до конца, даже если каталог обновится
+    catalog = services_catalog.current
+    users_data[user_id]['catalog'] = catalog
+
     users_data[user_id]['orders_services'] = {
-        '+1 Комната': {
-            'service_id': services_dict['+1 Комната']['id'],
+        EXTRA_ROOM: {
+            'service_id': catalog.services_dict[EXTRA_ROOM]['id'],
             'quantity_services': 0
         },
-        '+1 Санузел': {
-            'service_id': services_dict['+1 Санузел']['id'],
+        EXTRA_BATHROOM: {
+            'service_id': catalog.services_dict[EXTRA_BATHROOM]['id'],
             'quantity_services': 0
         }
     }
@@ -354,76 +681,141 @@ async def cmd_calculate_handler(msg: Message) -> None:
             'order_detail': order_detail
         }
 
-    # Базовый прайс за 1 комнату + 1 санузел
-    default_price = services_dict['1 Комната']['price'] + services_dict['1 Санузел']['price']
-
-    # Базовое время выполнения работы
-    default_time = float(services_dict['1 Комната']['lead_time']) + float(services_dict['1 Санузел']['lead_time'])
+    # Базовый прайс и время выполнения работы за 1 комнату + 1 санузел
+    quote = calculate_quote(users_data[user_id])
     await msg.answer(
         text=text.CALCULATE_MSG.format(
-            total_price=html.bold(default_price),
-            total_time=html.bold(default_time)
+            total_price=html.bold(to_major(quote.total_price)),
+            total_time=html.bold(quote.hours)
         ),
-        reply_markup=create_calculate_ikb(default_price, default_time)
+        reply_markup=create_calculate_ikb()
+    )
+
+
+# Постраничный вывод истории заказов
+ORDERS_PAGE_SIZE = 5
+ORDER_HISTORY_STATUSES = ('Принят', 'Завершен')
+
+
+async def render_orders_page(user: dict, page: int = 1, after: tuple = None,
+                             before: tuple = None) -> tuple or None:
+    """
+    Формирует сообщение со страницей истории заказов пользователя и кнопками перехода между страницами.
+
+    :param user: Запись пользователя из таблицы Users.
+    :param page: Номер страницы.
+    :param after: (order_date, id) последнего заказа предыдущей страницы.
+    :param before: (order_date, id) первого заказа следующей страницы.
+    :return: Текст сообщения и клавиатура или None, если заказов на странице нет.
+    """
+
+    orders_list = await async_db_manager.get_orders_page(
+        user['id'], ORDER_HISTORY_STATUSES, ORDERS_PAGE_SIZE, after=after, before=before
+    )
+    if not orders_list:
+        return None
+
+    count = await async_db_manager.count_orders(user['id'], ORDER_HISTORY_STATUSES)
+    pages = max(1, -(-count // ORDERS_PAGE_SIZE))
+
+    # Частота заказов пользователя за последние 30 дней
+    orders_frequency = await async_db_manager.get_order_frequency(user['tg_id'])
+
+    # Наибольшая скидка в соответствие с полученной частотой заказов, если она существует
+    discount = await async_db_manager.run(discount_index.best_discount, orders_frequency)
+    discount = discount['discount_value'] if discount else 0
+
+    orders = []
+    for dt in orders_list:
+        orders.append(text.ORDER_HISTORY_MSG.format(
+            **dict(
+                dt,
+                order_date=datetime.fromtimestamp(int(dt['order_date'])).strftime('%d.%m.%Y'),
+                appointment_datetime=datetime.fromtimestamp(dt['appointment_datetime']).strftime('%d.%m.%Y %H:%M'),
+                employee_fio=f'{dt["first_name"]} {dt["last_name"]} {dt["surname"]}'
+            )
+        ))
+
+    msg_txt = text.ORDER_HISTORY_PAGE_MSG.format(
+        page=page,
+        pages=pages,
+        count=count,
+        orders=text.ORDER_HISTORY_SEPARATOR.join(orders),
+        discount=text.DISCOUNT_MSG.format(discount=discount)
     )
 
+    # Ключи первого и последнего заказа страницы для перехода на соседние страницы
+    first, last = orders_list[0], orders_list[-1]
+    builder = InlineKeyboardBuilder()
+    if page > 1:
+        builder.button(
+            text=text.PREV_PAGE_BTN,
+            callback_data=OrdersPageCallback(
+                direction='prev', page=page - 1, order_date=first['order_date'], order_id=first['id']
+            )
+        )
+    if page < pages:
+        builder.button(
+            text=text.NEXT_PAGE_BTN,
+            callback_data=OrdersPageCallback(
+                direction='next', page=page + 1, order_date=last['order_date'], order_id=last['id']
+            )
+        )
+    return msg_txt, builder.as_markup()
+
 
 @dp.message(Command('orders'))
 async def cmd_orders_handler(msg: Message) -> None:
     user_id = msg.from_user.id
     dict_clear(user_id)
 
-    if users_data.get(user_id, {}).get('user'):
-        # Получение списка заказов пользователя
-        orders_list = db_manager.cur.execute(
-            """
-                SELECT Orders.*, Staff.first_name, Staff.last_name, Staff.Surname
-                FROM Orders
-                JOIN Staff ON Orders.staff_id = Staff.id
-                WHERE Orders.user_id = ? AND Orders.status IN (?, ?)
-            """, (users_data[user_id]['user']['id'], 'Принят', 'Завершен')).fetchall()
-        if orders_list:
-            orders_list = [dict(i) for i in orders_list]
-
-            # Частота заказов пользователя за последние 30 дней
-            orders_frequency = db_manager.get_order_frequency(user_id)
-
-            # Получение записи со скидкой в соответствие с полученной частотой заказов, если она существует
-            discounts_list = db_manager.cur.execute(
-                'SELECT * FROM Discounts WHERE orders_frequency <= ?',
-                (orders_frequency,)
-            ).fetchall()
-            discount = None
-            if discounts_list:
-                discounts_list = [dict(i) for i in discounts_list]
-                # Выбираем наибольшую скидку
-                discount = discounts_list[0]
-                if len(discounts_list) > 1:
-                    for i in discounts_list[1:]:
-                        if i['discount_value'] > discount['discount_value']:
-                            discount = i
-
-            for i in orders_list:
-                dt = i
-                dt['order_date'] = int(dt['order_date'])
-                dt['order_date'] = datetime.fromtimestamp(dt['order_date']).strftime('%d.%m.%Y')
-                dt['appointment_datetime'] = datetime.fromtimestamp(dt['appointment_datetime']).strftime('%d.%m.%Y %H:%M')
-                dt['employee_fio'] = f'{dt["first_name"]} {dt["last_name"]} {dt["surname"]}'
-                await msg.answer(text=text.ORDER_HISTORY_MSG.format(**dt))
-
-            discount = discount['discount_value'] if discount else 0
-            await msg.answer(text=text.DISCOUNT_MSG.format(discount=discount))
-        else:
-            await msg.answer(text.EMPTY_ORDER_HISTORY)
+    user = users_data.get(user_id, {}).get('user')
+    page = await render_orders_page(user) if user else None
+    if page:
+        msg_txt, ikb = page
+        await msg.answer(text=msg_txt, reply_markup=ikb)
     else:
         await msg.answer(text.EMPTY_ORDER_HISTORY)
 
 
+@dp.callback_query(OrdersPageCallback.filter())
+async def orders_page_handler(cb_query: CallbackQuery, callback_data: OrdersPageCallback) -> None:
+    user_id = cb_query.from_user.id
+
+    key = (callback_data.order_date, callback_data.order_id)
+
+    user = users_data.get(user_id, {}).get('user')
+    page = await render_orders_page(
+        user,
+        page=callback_data.page,
+        after=key if callback_data.direction == 'next' else None,
+        before=key if callback_data.direction == 'prev' else None
+    ) if user else None
+
+    if page:
+        msg_txt, ikb = page
+        await cb_query.message.edit_text(text=msg_txt, reply_markup=ikb)
+    else:
+        await cb_query.answer(text=text.EMPTY_ORDER_HISTORY)
+
+
+@dp.message(Command('reload_services'))
+async def cmd_reload_services_handler(msg: Message) -> None:
+    # Перечитывание каталога услуг администратором после изменения цен
+    staff_data = await async_db_manager.get_staff_data(msg.from_user.id)
+    if not staff_data or not staff_data['is_admin']:
+        return
+
+    reloaded = await async_db_manager.run(services_catalog.refresh, True)
+    msg_txt = text.SERVICES_RELOADED_MSG if reloaded else text.SERVICES_NOT_RELOADED_MSG
+    await msg.answer(text=msg_txt.format(version=services_catalog.current.version))
+
+
 @dp.message(F.text.in_({'Назначить персонал', 'Заказы'}))
 async def select_staff_handler(msg: Message) -> None:
     user_id = msg.from_user.id
     dict_clear(user_id)
-    if users_data[user_id].get('user', {}).get('is_admin') or db_manager.get_staff_data(user_id)['is_admin']:
+    if users_data[user_id].get('user', {}).get('is_admin') or (await async_db_manager.get_staff_data(user_id) or {}).get('is_admin'):
         if msg.text == 'Назначить персонал':
             users_data[user_id]['add_staff'] = True
             await msg.answer(text=text.ADD_STAFF)
@@ -453,9 +845,9 @@ async def input_user_data(msg: Message) -> None:
         if number == 5:
             new_user = {i[0]: i[2] for i in users_data[user_id]['reg'].values() if isinstance(i, list)}
             new_user['tg_id'] = user_id
-            rec = db_manager.insert_record('Users', **new_user)
+            rec = await async_db_manager.insert_record('Users', **new_user)
             if rec:
-                users_data[user_id]['user'] = rec
+                users_data[user_id]['user'] = db_manager.user_profiles.get(user_id) or rec
                 msg_txt = text.CONFIRM_USER_DATA_MSG.format(**users_data[user_id]['user'])
                 keyboard = udata_confirm_ikb
                 del users_data[user_id]['reg']
@@ -518,7 +910,11 @@ async def input_user_data(msg: Message) -> None:
     if flag == True:
         key = tuple(param.keys())[0]
         del users_data[user_id][key]
-        rec = db_manager.update_record('Users', users_data[user_id]['user']['id'], **param[key])
+        if 'user' not in u_dt:
+            await msg.answer(text=text.SESSION_EXPIRED_MSG)
+            return
+
+        rec = await async_db_manager.update_record('Users', users_data[user_id]['user']['id'], **param[key])
         if rec:
             users_data[user_id]['user'].update(rec)
             msg_txt = text.CONFIRM_USER_DATA_MSG.format(**users_data[user_id]['user'])
@@ -531,59 +927,39 @@ async def input_user_data(msg: Message) -> None:
             await msg.answer(text=text.ERROR_MSG)
 
 
-@dp.callback_query(F.data.startswith('minus-room') | F.data.startswith('plus-room') | F.data.startswith('minus-bathroom') | F.data.startswith('plus-bathroom'))
-async def room_and_bathroom_change_handler(cb_query: CallbackQuery) -> None:
-    cb_data = cb_query.data.split('_')
+@dp.callback_query(CalcCallback.filter())
+async def room_and_bathroom_change_handler(cb_query: CallbackQuery, callback_data: CalcCallback) -> None:
     user_id = cb_query.from_user.id
 
-    # Получение стоимости за доп 1 комнату и доп 1 санузел
-    plus_room = services_dict['+1 Комната']['price']
-    plus_bathroom = services_dict['+1 Санузел']['price']
-    actions = {
-        'minus-room': (-1, plus_room, 'room'),
-        'plus-room': (1, plus_room, 'room'),
-        'minus-bathroom': (-1, plus_bathroom, 'bathroom'),
-        'plus-bathroom': (1, plus_bathroom, 'bathroom')
-    }
+    session = users_data.get(user_id, {})
+    if 'order_detail' not in session or 'orders_services' not in session:
+        await cb_query.answer(text=text.SESSION_EXPIRED_MSG)
+        return
 
-    action = cb_data[0]
-    change, price_change, characteristic = actions[action]
-    ind = 1 if characteristic == 'room' else 2
-    tm = services_dict['+1 Комната']['lead_time'] if ind < 2 else services_dict['+1 Санузел']['lead_time']
-    service = '+1 Комната' if characteristic == 'room' else '+1 Санузел'
-    tm = float(tm)
+    characteristic = callback_data.item
+    service = EXTRA_ROOM if characteristic == 'room' else EXTRA_BATHROOM
+    change = 1 if callback_data.change > 0 else -1
 
-    # Стоимость и время уборки
-    total_price = int(cb_data[3])
-    total_time = float(cb_data[4])
-
-    if action.startswith('minus'):
-        if int(cb_data[ind]) > 1:
-            cb_data[ind] = int(cb_data[ind]) + change
-            total_price -= price_change
-            total_time -= tm
-            users_data[user_id]['orders_services'][service]['quantity_services'] -= 1
-        else:
-            return
+    # Меньше одной комнаты или санузла быть не может
+    if session['order_detail'][characteristic] + change < 1:
+        return
 
-    elif action.startswith('plus'):
-        cb_data[ind] = int(cb_data[ind]) + change
-        total_price += price_change
-        total_time += tm
-        users_data[user_id]['orders_services'][service]['quantity_services'] += 1
+    session['order_detail'][characteristic] += change
+    session['orders_services'][service]['quantity_services'] += change
 
-    users_data[user_id]['order_detail'][characteristic] += change
+    # Стоимость и время уборки
+    quote = calculate_quote(session)
 
     await cb_query.message.edit_text(
         text=text.CALCULATE_MSG.format(
-            total_price=html.bold(total_price),
-            total_time=html.bold(total_time)
+            total_price=html.bold(to_major(quote.total_price)),
+            total_time=html.bold(quote.hours)
         ),
-        reply_markup=create_calculate_ikb(total_price, total_time, int(cb_data[1]), int(cb_data[2]))
+        reply_markup=create_calculate_ikb(session['order_detail']['room'], session['order_detail']['bathroom'])
     )
 
 
-@dp.callback_query(F.data.startswith('calculate-cleaning'))
+@dp.callback_query(CalculateCallback.filter())
 async def calculate_cleaning_handler(cb_query: CallbackQuery) -> None:
     user_id = cb_query.from_user.id
 
@@ -594,23 +970,19 @@ async def calculate_cleaning_handler(cb_query: CallbackQuery) -> None:
         )
         return
 
+    if 'order_detail' not in users_data.get(user_id, {}):
+        await cb_query.answer(text=text.SESSION_EXPIRED_MSG)
+        return
+
     # Получение предварительной стоимости и времени
-    total_price = int(cb_query.data.split('_')[1])
-    total_time = float(cb_query.data.split('_')[2])
+    users_data[user_id].pop('services', None)
+    quote = calculate_quote(users_data[user_id])
 
     # Добавляем рассчитанные стоимость и время в словарь, формируя заказ
-    if users_data.get(user_id):
-        users_data[user_id]['order'] = {
-            'total_price': total_price,
-            'total_time': total_time
-        }
-    else:
-        users_data[user_id] = {
-            'order': {
-                'total_price': total_price,
-                'total_time': total_time
-            }
-        }
+    users_data[user_id]['order'] = {
+        'total_price': to_major(quote.total_price),
+        'total_time': quote.hours
+    }
     calendar = SimpleCalendar()
     await cb_query.message.edit_text(
         text=text.QUESTION_ARRIVAL_TIME_MSG,
@@ -630,59 +1002,34 @@ async def process_simple_calendar(callback_query: CallbackQuery, callback_data:
     selected, date = await calendar.process_selection(callback_query, callback_data)
 
     if selected:
+        if 'order' not in users_data.get(user_id, {}):
+            await callback_query.answer(text=text.SESSION_EXPIRED_MSG)
+            return
+
         # Добавление даты в заказ
         users_data[user_id]['order']['appointment_datetime'] = date
 
         await callback_query.message.edit_text(
             text=text.TIME_SELECTION_PROMPT_MSG,
-            reply_markup=create_time_ikb()
-        )
-
-
-@dp.callback_query(F.data.startswith(('plus-hour', 'plus-minute', 'minus-hour', 'minus-minute')))
-async def time_choice_handler(cb_query: CallbackQuery) -> None:
-    cb_data = cb_query.data.split('_')
-    action, hours, minutes = cb_data[0], int(cb_data[1]), int(cb_data[2])
-
-    if action == 'plus-hour':
-        if (hours, minutes) not in ((17, 30), (18, 0)):
-            hours += 1
-    elif action == 'plus-minute':
-        if hours != 18:
-            if minutes == 30:
-                minutes = 0
-                hours += 1
-            else:
-                minutes += 30
-    elif action == 'minus-hour':
-        if hours != 9:
-            hours -= 1
-    elif action == 'minus-minute':
-        if (hours, minutes) != (9, 0):
-            if minutes == 0:
-                minutes = 30
-                hours -= 1
-            else:
-                minutes -= 30
-
-    try:
-        await cb_query.message.edit_text(
-            text=text.TIME_SELECTION_PROMPT_MSG,
-            reply_markup=create_time_ikb(hours, minutes)
+            reply_markup=create_time_ikb(*TIME_PICKER_SLOTS[0])
         )
-    except aiogram.exceptions.TelegramBadRequest as e:
-        pass
 
 
-@dp.callback_query(F.data.startswith('confirm'))
-async def confirm_handler(cb_query: CallbackQuery) -> None:
+@dp.callback_query(TimeCallback.filter())
+async def time_choice_handler(cb_query: CallbackQuery, callback_data: TimeCallback) -> None:
     user_id = cb_query.from_user.id
+    hours, minutes = callback_data.hours, callback_data.minutes
+    if (hours, minutes) not in TIME_PICKER_SLOTS:
+        return
 
     # Подтверждение выбранного времени
-    if cb_query.data.startswith('confirm-time'):
+    if callback_data.action == 'ok':
+        if not isinstance(users_data.get(user_id, {}).get('order', {}).get('appointment_datetime'), datetime):
+            await cb_query.answer(text=text.SESSION_EXPIRED_MSG)
+            return
+
         # Получение и добавление выбранного времени в заказ
-        _, hours, minutes = cb_query.data.split('_')
-        time = timedelta(hours=int(hours), minutes=int(minutes))
+        time = timedelta(hours=hours, minutes=minutes)
         users_data[user_id]['order']['appointment_datetime'] += time
 
         # Перезаписываем дату и время в Unix
@@ -690,92 +1037,99 @@ async def confirm_handler(cb_query: CallbackQuery) -> None:
         users_data[user_id]['order']['appointment_datetime'] = dt.timestamp()
 
 
-        # Список для хранения индексов дополнительных услуг
+        # Список для хранения id дополнительных услуг
         users_data[user_id]['services'] = []
         await cb_query.message.edit_text(
             text=text.OPTIONS_MSG.format(
                 total_price=html.bold(users_data[user_id]['order']['total_price']),
                 total_time=html.bold(users_data[user_id]['order']['total_time'])
         ),
-            reply_markup=additional_services_ikb
+            reply_markup=create_services_ikb(session_catalog(users_data[user_id]))
         )
+        return
 
-    # Подтверждение данных пользователя
-    elif cb_query.data.startswith('confirm-udata'):
-        # Добавление адреса в заказ
-        users_data[user_id]['order']['address'] = users_data[user_id]['user']['address']
+    # Шаг 30 минут, время от 09:00 до 18:00
+    step = 60 if callback_data.action == 'hour' else 30
+    total = hours * 60 + minutes + step * (1 if callback_data.change > 0 else -1)
+    if (total // 60, total % 60) not in TIME_PICKER_SLOTS:
+        return
+    hours, minutes = total // 60, total % 60
 
+    try:
         await cb_query.message.edit_text(
-            text=text.PAYMENT_MSG,
-            reply_markup=payment_ikb
+            text=text.TIME_SELECTION_PROMPT_MSG,
+            reply_markup=create_time_ikb(hours, minutes)
         )
+    except aiogram.exceptions.TelegramBadRequest as e:
+        pass
 
-    # Подтверждение заказа персоналом
-    elif cb_query.data.startswith('confirm-order-staff'):
-        user_tg_id = int(cb_query.data.split('_')[1])
-        order_number = int(cb_query.data.split('_')[2])
-        employee_tg_id = user_id
-
-        # Получаем запись о сотруднике из БД
-        employee_rec = db_manager.get_record('Staff', tg_id=employee_tg_id)
-
-        fio = f"{employee_rec['last_name']} {employee_rec['first_name']} {employee_rec['surname']}"
-        users_data[user_tg_id]['order_info'].update(employee_fio=fio)
-
-        # Добавляем сотрудника к заказу
-        rec = db_manager.update_record('Orders', order_number, staff_id=employee_rec['id'], status='Принят')
-        if rec:
-            users_data[user_tg_id]['order'].update(rec)
-            users_data[user_tg_id]['order_info'].update(rec)
-
-            order_info = users_data[user_tg_id]['order_info']
 
-            order_info['appointment_datetime'] = datetime.fromtimestamp(order_info['appointment_datetime']).strftime("%d.%m.%Y %H:%M")
-            order_info['order_date'] = datetime.fromtimestamp(int(order_info['order_date'])).strftime("%d.%m.%Y")
+@dp.callback_query(F.data.startswith('confirm'))
+async def confirm_handler(cb_query: CallbackQuery) -> None:
+    user_id = cb_query.from_user.id
 
+    # Подтверждение данных пользователя
+    if cb_query.data.startswith('confirm-udata'):
+        session = users_data.get(user_id, {})
+        if 'order' not in session or 'user' not in session:
+            await cb_query.answer(text=text.SESSION_EXPIRED_MSG)
+            return
 
-            # Ставим часы сотруднику в гугл таблице
-            wsh = sh.get_worksheet(0)
-            row = wsh.find(fio).row
-            col = datetime.fromtimestamp(users_data[user_tg_id]['order']['appointment_datetime']).day + 1
-            wsh.update_cell(row, col, users_data[user_tg_id]['order']['total_time'] + 1)
+        # Добавление адреса в заказ
+        users_data[user_id]['order']['address'] = users_data[user_id]['user']['address']
 
-            # Отправляем оповещение о заказе сотруднику, админам и пользователю
-            await bot.edit_message_text(
-                chat_id=employee_rec['tg_id'],
-                text=text.ORDER_MSG.format(**order_info),
-                message_id=cb_query.message.message_id
-            )
+        await cb_query.message.edit_text(
+            text=text.PAYMENT_MSG,
+            reply_markup=payment_ikb
+        )
 
-            await bot.send_message(
-                chat_id=admin_chat_id,
-                text=text.ORDER_MSG.format(**order_info)
-            )
 
-            await bot.send_message(
-                chat_id=user_tg_id,
-                text=text.ORDER_MSG.format(**order_info)
-            )
+@dp.callback_query(StaffOrderCallback.filter())
+async def staff_order_handler(cb_query: CallbackQuery, callback_data: StaffOrderCallback) -> None:
+    # Подтверждение заказа персоналом
+    order_number = callback_data.order_id
 
-            # Удаляем задачу
-            scheduler.remove_job(users_data[user_tg_id]['job_id'])
-        else:
-            await cb_query.answer(text=text.ERROR_MSG)
+    # Получаем запись о сотруднике из БД
+    employee_rec = await async_db_manager.get_record('Staff', tg_id=cb_query.from_user.id)
+
+    # Добавляем сотрудника к заказу, если заказ еще не распределен
+    order = await async_db_manager.get_order_details(order_number)
+    order_info = None
+    if employee_rec and order and order['status'] == 'В обработке':
+        order_info = await accept_order(order_number, employee_rec)
+
+    if order_info:
+        # Отправляем оповещение о заказе сотруднику, админам и пользователю
+        msg_txt = text.ORDER_MSG.format(**order_info)
+        await notifier.notify(
+            {
+                'employee': lambda: bot.edit_message_text(
+                    chat_id=employee_rec['tg_id'],
+                    text=msg_txt,
+                    message_id=cb_query.message.message_id
+                ),
+                'admin': lambda: bot.send_message(chat_id=admin_chat_id, text=msg_txt),
+                'customer': lambda: bot.send_message(chat_id=order_info['user_tg_id'], text=msg_txt)
+            },
+            priorities={'admin': PRIORITY_LOW}
+        )
+    else:
+        await cb_query.answer(text=text.ERROR_MSG)
 
 
-@dp.callback_query(F.data.startswith('additional-service'))
-async def services_checkboxes_handler(cb_query: CallbackQuery) -> None:
+@dp.callback_query(ServiceCallback.filter())
+async def services_checkboxes_handler(cb_query: CallbackQuery, callback_data: ServiceCallback) -> None:
     user_id = cb_query.from_user.id
 
-    ind = int(cb_query.data.split('_')[1])
-    if ind == len(additional_services_buttons) - 1:
-        # Получение id выбранных услуг и добавление их в словарь пользователя
-        services_ids = []
-        for i in users_data[user_id]['services']:
-            services_ids.append(additional_services[i]['id'])
-
-        users_data[user_id]['services'] = services_ids
+    if 'services' not in users_data.get(user_id, {}):
+        await cb_query.answer(text=text.SESSION_EXPIRED_MSG)
+        return
 
+    catalog = session_catalog(users_data[user_id])
+    ind = callback_data.index
+    if not 0 <= ind < len(catalog.additional_services_buttons):
+        return
+    if ind == len(catalog.additional_services_buttons) - 1:
         # Проверка пользователя в БД
         user = users_data[user_id].get('user')
         if user:
@@ -802,91 +1156,75 @@ async def services_checkboxes_handler(cb_query: CallbackQuery) -> None:
         )
         return
 
-    btns = additional_services_buttons.copy()
-
-    # Проверяем был ли добавлен индекс выбранной услуги, если да, то удаляем его
-    if ind in users_data[user_id]['services']:
-        users_data[user_id]['services'].remove(ind)
-        btns[ind] = '➖' + btns[ind][1:]
-        # Изменяем стоимость и время выполнения, вычитая выбранную услугу
-        users_data[user_id]['order']['total_price'] -= services_dt[ind]['price']
-        users_data[user_id]['order']['total_time'] -= float(services_dt[ind]['lead_time'])
+    # Проверяем была ли добавлена выбранная услуга, если да, то удаляем ее
+    service_id = catalog.additional_services[ind]['id']
+    if service_id in users_data[user_id]['services']:
+        users_data[user_id]['services'].remove(service_id)
     else:
-        # Добавляем индексы выбранных услуг
-        users_data[user_id]['services'].append(ind)
-        # Изменяем стоимость и время выполнения, прибавляя выбранную услугу
-        users_data[user_id]['order']['total_price'] += services_dt[ind]['price']
-        users_data[user_id]['order']['total_time'] += float(services_dt[ind]['lead_time'])
+        users_data[user_id]['services'].append(service_id)
 
-    for i in users_data[user_id]['services']:
-        btns[i] = '✅' + btns[i][1:]
+    # Пересчитываем стоимость и время выполнения
+    quote = calculate_quote(users_data[user_id])
+    users_data[user_id]['order']['total_price'] = to_major(quote.total_price)
+    users_data[user_id]['order']['total_time'] = quote.hours
+
+    selected = sum(
+        1 << i for i, service in enumerate(catalog.additional_services) if service['id'] in quote.services
+    )
 
     await cb_query.message.edit_text(
         text=text.OPTIONS_MSG.format(
             total_price=html.bold(users_data[user_id]['order']['total_price']),
             total_time=html.bold(users_data[user_id]['order']['total_time'])
         ),
-        reply_markup=create_ikb(btns, callback_prefix='additional-service')
+        reply_markup=create_services_ikb(catalog, selected)
     )
 
 
-@dp.callback_query(F.data.startswith('payment'))
-async def payment_choice_handler(cb_query: CallbackQuery) -> None:
+@dp.callback_query(PaymentCallback.filter())
+async def payment_choice_handler(cb_query: CallbackQuery, callback_data: PaymentCallback) -> None:
     user_id = cb_query.from_user.id
 
+    if 'order' not in users_data.get(user_id, {}) or not 0 <= callback_data.index < len(payment_list):
+        await cb_query.answer(text=text.SESSION_EXPIRED_MSG)
+        return
+
     # Получение способа оплаты
-    ind = int(cb_query.data.split('_')[1])
-    payment = payment_list[ind]
+    payment = payment_list[callback_data.index]
 
     # Добавление способа оплаты в заказ
     users_data[user_id]['order']['payment'] = payment
 
     # Частота заказов пользователя за последние 30 дней
-    orders_frequency = db_manager.get_order_frequency(user_id)
-
-    # Получение записи со скидкой в соответствие с полученной частотой заказов, если она существует
-    discounts_list = db_manager.cur.execute(
-        'SELECT * FROM Discounts WHERE orders_frequency <= ?',
-        (orders_frequency, )
-    ).fetchall()
-    if discounts_list:
-        discounts_list = [dict(i) for i in discounts_list]
-        # Выбираем наибольшую скидку
-        discount = discounts_list[0]
-        if len(discounts_list) > 1:
-            for i in discounts_list[1:]:
-                if i['discount_value'] > discount['discount_value']:
-                    discount = i
-        users_data[user_id]['order']['discount_id'] = discount['id']
+    orders_frequency = await async_db_manager.get_order_frequency(user_id)
 
-    discount = users_data[user_id]['order'].get('discount_id')
+    # Наибольшая скидка в соответствие с полученной частотой заказов, если она существует
+    discount = await async_db_manager.run(discount_index.best_discount, orders_frequency)
     if discount:
-        discount = db_manager.get_record('Discounts', id=discount)
+        users_data[user_id]['order']['discount_id'] = discount['id']
         discount = discount['discount_value']
     else:
+        users_data[user_id]['order'].pop('discount_id', None)
         discount = 0
 
     # Добавляем скидку в детали к заказу
     users_data[user_id]['order_detail']['discount'] = discount
 
-    # Сумма скидки
-    discount_price = users_data[user_id]['order']['total_price'] * discount / 100
+    # Общая стоимость с учетом скидки
+    quote = calculate_quote(users_data[user_id], discount)
+    users_data[user_id]['order']['total_price'] = to_major(quote.total_price)
+    users_data[user_id]['order']['total_time'] = quote.hours
 
-    # Обновляем общую стоимость
-    users_data[user_id]['order']['total_price'] = users_data[user_id]['order']['total_price'] - discount_price
-
-    # Получаем доп услуги выбранные пользователем
-    services = []
-    services_price = 0
-    for service in services_dt:
-        if service['id'] in users_data[user_id]['services']:
-            services.append(f'{service["name"]} - {service["price"]} р')
-            services_price += service['price']
+    # Доп услуги выбранные пользователем
+    pricing = session_catalog(users_data[user_id]).pricing
+    services = [
+        f'{pricing.names[pricing.position[i]]} - {to_major(pricing.price_of(i))} р' for i in quote.services
+    ]
 
     order_info = users_data[user_id]['order'].copy()
     order_info.update(users_data[user_id]['order_detail'])
     order_info['services'] = '\n'.join(services)
-    order_info['price'] = round((order_info['total_price'] - services_price), 2)
+    order_info['price'] = standard_price(pricing, order_info['room'], order_info['bathroom'])
     order_info['appointment_datetime'] = datetime.fromtimestamp(order_info['appointment_datetime']).strftime("%Y.%m.%d %H:%M")
 
     users_data[user_id]['order_info'] = order_info
@@ -901,6 +1239,11 @@ async def payment_choice_handler(cb_query: CallbackQuery) -> None:
 async def order_checkout_handler(cb_query: CallbackQuery) -> None:
     user_id = cb_query.from_user.id
 
+    session = users_data.get(user_id, {})
+    if any(key not in session for key in ('order', 'user', 'services', 'orders_services', 'order_info')):
+        await cb_query.answer(text=text.SESSION_EXPIRED_MSG)
+        return
+
     # Добавляем день заказа
     today = datetime.now().timestamp()
     users_data[user_id]['order']['order_date'] = today
@@ -908,31 +1251,25 @@ async def order_checkout_handler(cb_query: CallbackQuery) -> None:
     # Добавляем user_id к заказу
     users_data[user_id]['order']['user_id'] = users_data[user_id]['user']['id']
 
-    # Добавляем заказ в БД `Orders`
-    rec = db_manager.insert_record('Orders', **users_data[user_id]['order'])
+    # Услуги заказа для `OrdersServices`: базовые, выбранные дополнительные и доп. комнаты/санузлы
+    services_dict = session_catalog(users_data[user_id]).services_dict
+    services_ids = users_data[user_id]['services'] + [services_dict[ROOM]['id'], services_dict[BATHROOM]['id']]
+    orders_services = [{'service_id': i, 'quantity_services': 1} for i in services_ids]
+    for key, value in users_data[user_id]['orders_services'].items():
+        if value['quantity_services'] > 0:
+            orders_services.append({
+                'service_id': value['service_id'],
+                'quantity_services': value['quantity_services']
+            })
+
+    # Добавляем заказ в БД `Orders` вместе с услугами одной транзакцией
+    rec = await async_db_manager.insert_order(users_data[user_id]['order'], orders_services)
 
     if rec:
-        # Перезаписываем имеющийся словарь
-        users_data[user_id]['order'] = dict(rec)
-
-        # Добавляем выбранные услуги в `OrdersServices`
-        users_data[user_id]['services'].extend([services_dict['1 Комната']['id'], services_dict['1 Санузел']['id']])
-        for i in users_data[user_id]['services']:
-            db_manager.insert_record(
-                'OrdersServices',
-                order_id=users_data[user_id]['order']['id'],
-                service_id=i,
-                quantity_services=1
-            )
+        del rec['services']
 
-        for key, value in users_data[user_id]['orders_services'].items():
-            if value['quantity_services'] > 0:
-                db_manager.insert_record(
-                    'OrdersServices',
-                    order_id=users_data[user_id]['order']['id'],
-                    service_id=value['service_id'],
-                    quantity_services=value['quantity_services']
-                )
+        # Перезаписываем имеющийся словарь
+        users_data[user_id]['order'] = rec
 
         # Обновляем order_info
         users_data[user_id]['order_info'].update(users_data[user_id]['order'])
@@ -951,85 +1288,77 @@ async def order_checkout_handler(cb_query: CallbackQuery) -> None:
     # День заказа
     appointment_datetime = users_data[user_id]['order']['appointment_datetime']
     order_datetime = datetime.fromtimestamp(appointment_datetime)
-    day = str(order_datetime.day)
 
     # Время выполнения заказа + 1 час дороги
     execution_time = users_data[user_id]['order']['total_time'] + 1
 
-    employee = None
-
-    # Проверяем относится ли заказ к этому месяцу и есть ли свободные в этот день сотрудники
-    if is_same_month(appointment_datetime):
-        # Проверяем вписывается ли по времени выполнение заказа в назначенный день
-        dt = order_datetime + timedelta(hours=execution_time)
-        if dt.time() > datetime.strptime('21:00', '%H:%M').time():
-            # Отдаем заказ на рассмотрение админу
-            await bot.send_message(
-                chat_id=admin_chat_id,
-                text=text.ORDER_MSG.format(**users_data[user_id]['order_info'])
+    employee_rec = None
+
+    # Проверяем вписывается ли по времени выполнение заказа в назначенный день
+    fits = fits_working_day(order_datetime, execution_time)
+
+    if fits and not sh.available:
+        # Google таблица еще не открыта и графика нет: сохраняем задачу распределения, заказ распределится
+        # после загрузки графика (в том числе после перезапуска бота), а не уйдет сразу админу
+        order_number = users_data[user_id]['order']['id']
+        job = await async_db_manager.insert_record('AutoAssignJobs', order_id=order_number, run_at=int(today))
+        if job:
+            scheduler.add_job(
+                auto_assign_after_schedule,
+                kwargs={'job_id': job['id']},
+                id=f'auto-assign-{order_number}',
+                replace_existing=True,
+                misfire_grace_time=None
             )
-        else:
-            # Получение графика работы
-            worksheet = sh.get_worksheet(0)
-            worksheet = worksheet.get_all_records()
-
-            # Список свободных и список уже работавших сотрудников у которых день заказа совпадает с рабочим днем
-            free_staff = [item for item in worksheet if
-                          isinstance(item[day], int) and item[day] >= 0 and sum_values_of_current_week(item) + execution_time <= 40]
-            active_staff = [item for item in worksheet if
-                            isinstance(item[day], int) and item[day] < 10 and sum_values_of_current_week(item) + execution_time <= 40]
-
-            # В приоритете свободные сотрудники, но если таких нет то смотрим среди тех, кто уже работал
-            if free_staff:
-                employee = random.choice(free_staff)
-            elif active_staff:
-                # Выбираем тех сотрудников которые могут выполнить этот заказ не выйдя за рамки 10 рабочих часов в день
-                buf = []
-                for item in active_staff:
-                    if item[day] + execution_time <= 10:
-                        buf.append(item)
-                active_staff = buf
-                employee = random.choice(active_staff)
-
-            if employee:
-                # Получаем запись о сотруднике из БД
-                fio = employee['ФИО']
-                fio = fio.split(' ')
-
-                employee_rec = db_manager.get_record('Staff', last_name=fio[0], first_name=fio[1], surname=fio[2])
-
-                # Отправляем заказ сотруднику
-                order_number = users_data[user_id]['order']['id']
-
-                ikb = create_ikb(
-                    {f'confirm-order-staff_{user_id}_{order_number}': 'Принять заказ'}
-                )
+            return
 
-                msg = await bot.send_message(
-                    chat_id=employee_rec['tg_id'],
-                    text=text.ORDER_PROPOSAL_MSG.format(**users_data[user_id]['order_info']),
-                    reply_markup=ikb
-                )
+    if fits:
+        # Выбираем сотрудника, который работает в этот день и не выйдет за рамки 10 часов в день и 40 в неделю.
+        # В приоритете свободные в этот день сотрудники, затем менее загруженные
+        await assignment_engine.refresh(schedule_cache, async_db_manager)
+        fio = assignment_engine.choose(order_datetime, execution_time)
+
+        if fio:
+            # Получаем запись о сотруднике из БД
+            last_name, first_name, surname = fio.split(' ')
+            employee_rec = await async_db_manager.get_record(
+                'Staff', last_name=last_name, first_name=first_name, surname=surname
+            )
 
-                # Закидываем задачу в планировщик и ждем час, если нет ответа от сотрудника распределяем автоматически
-                tm = datetime.now() + timedelta(minutes=1)
-                params = {
-                    'msg_id': msg.message_id,
-                    'staff': free_staff + active_staff,
-                    'id': order_number,
-                    'chat_id': employee_rec['tg_id'],
-                    'user_id': user_id
+    if employee_rec:
+        # Отправляем заказ сотруднику
+        order_number = users_data[user_id]['order']['id']
 
-                }
-                job = scheduler.add_job(auto_assign_orders, 'date', next_run_time=tm, kwargs=params)
-                users_data[user_id]['job_id'] = job.id
+        ikb = create_ikb(
+            {StaffOrderCallback(order_id=order_number).pack(): 'Принять заказ'}
+        )
 
-            else:
-                # Если нет свободных сотрудников отдаем заказ админу
-                await bot.send_message(
-                    chat_id=admin_chat_id,
-                    text=text.ORDER_MSG.format(**users_data[user_id]['order_info'])
-                )
+        with priority(PRIORITY_HIGH):
+            msg = await bot.send_message(
+                chat_id=employee_rec['tg_id'],
+                text=text.ORDER_PROPOSAL_MSG.format(**users_data[user_id]['order_info']),
+                reply_markup=ikb
+            )
+
+        # Закидываем задачу в планировщик и ждем час, если нет ответа от сотрудника распределяем автоматически.
+        # Задача хранится в БД, чтобы пережить перезапуск бота
+        tm = datetime.now() + timedelta(minutes=1)
+        job = await async_db_manager.insert_record(
+            'AutoAssignJobs',
+            order_id=order_number,
+            msg_id=msg.message_id,
+            chat_id=employee_rec['tg_id'],
+            run_at=int(tm.timestamp())
+        )
+        if job:
+            schedule_auto_assign(job)
+
+    else:
+        # Если заказ не укладывается в рабочий день или нет свободных сотрудников отдаем заказ админу
+        await escalate_order(
+            users_data[user_id]['order']['id'],
+            text.ORDER_MSG.format(**users_data[user_id]['order_info'])
+        )
 
 
 @dp.callback_query(F.data.startswith('edit'))
@@ -1085,7 +1414,7 @@ async def add_admin_handler(cb_query: CallbackQuery) -> None:
 
     # Добавляем новую запись в `Staff`
     print(users_data[user_id]['add_staff_data'])
-    rec = db_manager.insert_record('Staff', **users_data[user_id]['add_staff_data'])
+    rec = await async_db_manager.insert_record('Staff', **users_data[user_id]['add_staff_data'])
     if rec:
         del users_data[user_id]['add_staff_data']['is_admin']
         rec['is_admin'] = 'Да' if rec['is_admin'] else 'Нет'
@@ -1097,8 +1426,75 @@ async def add_admin_handler(cb_query: CallbackQuery) -> None:
 
 
 async def main() -> None:
+    # Этапы инициализации, выполняются фоновыми задачами после запуска.
+    # Обновление схемы БД (индексы и т.д.)
+    startup.add('migrate', async_db_manager.migrate)
+    # Авторизация в Google и открытие таблицы (повторяется, пока Google недоступен)
+    startup.add('sheets', sh.connect)
+    startup.add('schedule', schedule_cache.get_records, requires=('sheets', ))
+    startup.add('catalog', load_catalog)
+    startup.add('keyboards', build_keyboards, requires=('catalog', ))
+    # Задачи автоматического распределения заказов, сохраненные до перезапуска
+    startup.add('auto_assign', restore_auto_assign_jobs, requires=('migrate', ))
+
+    # Периодическая сверка счетчика частоты заказов с БД
+    scheduler.add_job(db_manager.order_frequency.reconcile, 'interval', minutes=30)
+
+    # Удаление неактивных сессий пользователей
+    scheduler.add_job(evict_idle_sessions, 'interval', minutes=5)
+
+    # Проверка изменений каталога услуг (в пуле потоков БД)
+    scheduler.add_job(
+        async_db_manager.run,
+        'interval',
+        args=(services_catalog.refresh, ),
+        seconds=config.getfloat('Bot', 'catalog_poll_interval', fallback=30)
+    )
+
     scheduler.start()
-    await dp.start_polling(bot)
+    sheets_writer.start()
+    outbound.start()
+    startup.start()
+
+    try:
+        # Обработка сообщений начинается после обновления схемы БД, остальные этапы продолжаются в фоне
+        if not await startup.wait('migrate'):
+            return
+
+        if config.get('Bot', 'mode', fallback='polling') == 'webhook':
+            await run_webhook(
+                dp,
+                bot,
+                base_url=config['Webhook']['base_url'],
+                host=config.get('Webhook', 'host', fallback='127.0.0.1'),
+                port=config.getint('Webhook', 'port', fallback=8080),
+                path=config.get('Webhook', 'path', fallback='/webhook'),
+                secret_token=config.get('Webhook', 'secret_token', fallback=None),
+                max_tasks=config.getint('Webhook', 'max_tasks', fallback=100),
+                drain_timeout=config.getfloat('Webhook', 'drain_timeout', fallback=30)
+            )
+        else:
+            # start_polling не снимает вебхук, оставшийся после запуска в режиме webhook (иначе getUpdates
+            # завершается TelegramConflictError). Накопившиеся обновления сохраняются
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await startup.stop()
+
+        # Записываем в Google таблицу оставшиеся изменения
+        await sheets_writer.stop()
+
+        # Отправляем оставшиеся сообщения
+        await outbound.stop()
+        await bot.session.close()
+        logging.info('Этапы запуска: %s', startup.stats)
+        logging.info('Очередь исходящих сообщений: %s', outbound.stats)
+        logging.info('Оповещения о заказах: %s', notifier.stats)
+        logging.info('Кэш клавиатур: %s', keyboard_stats())
+        logging.info('Кэш графика работы: %s', schedule_cache.stats)
+        logging.info('Сессии пользователей: %s', users_data.stats)
+        logging.info('Кэш профилей пользователей: %s', db_manager.user_profiles.stats)
+        logging.info('Каталог услуг: %s', services_catalog.stats)
 
 if __name__ == "__main__":
     try:
@@ -1106,3 +1502,4 @@ if __name__ == "__main__":
         asyncio.run(main())
     finally:
         scheduler.shutdown()
+        async_db_manager.shutdown()
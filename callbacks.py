@@ -0,0 +1,69 @@
+from typing import Literal
+
+from aiogram.filters.callback_data import CallbackData
+
+
+# Данные кнопок в формате `префикс:поле:поле`. Префиксы короткие, чтобы данные укладывались в 64 байта.
+# Стоимость и время заказа в кнопки не передаются: они пересчитываются по данным сессии пользователя.
+# Строковые поля ограничены набором значений (Literal): данные с другим значением не проходят фильтр обработчика.
+
+
+class CalcCallback(CallbackData, prefix='cl'):
+    """
+    Изменение количества комнат или санузлов в калькуляторе.
+    """
+
+    item: Literal['room', 'bathroom']
+    change: int
+
+
+class CalculateCallback(CallbackData, prefix='cc'):
+    """
+    Переход от калькулятора к выбору даты.
+    """
+
+
+class TimeCallback(CallbackData, prefix='tm'):
+    """
+    Выбор времени уборки.
+    """
+
+    action: Literal['hour', 'minute', 'ok']
+    change: int
+    hours: int
+    minutes: int
+
+
+class ServiceCallback(CallbackData, prefix='sv'):
+    """
+    Выбор дополнительной услуги (индекс в списке кнопок).
+    """
+
+    index: int
+
+
+class PaymentCallback(CallbackData, prefix='pm'):
+    """
+    Выбор способа оплаты (индекс в списке способов).
+    """
+
+    index: int
+
+
+class StaffOrderCallback(CallbackData, prefix='so'):
+    """
+    Сотрудник принимает предложенный заказ.
+    """
+
+    order_id: int
+
+
+class OrdersPageCallback(CallbackData, prefix='op'):
+    """
+    Переход на соседнюю страницу истории заказов по ключу (order_date, id) крайнего заказа.
+    """
+
+    direction: Literal['next', 'prev']
+    page: int
+    order_date: float
+    order_id: int
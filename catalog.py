@@ -0,0 +1,136 @@
+import logging
+import threading
+
+from cleanny_db_manager import DBManager, db_manager
+from pricing import PricingEngine
+
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """
+    Версия каталога услуг: записи таблицы Services и все производные от них структуры.
+
+    Снимок не изменяется после создания. Сессия, начавшая оформление заказа, хранит ссылку на свой снимок
+    и рассчитывает стоимость по нему, даже если каталог уже обновлен.
+    """
+
+    __slots__ = ('version', 'services', 'services_dict', 'additional_services', 'additional_services_buttons',
+                 'pricing')
+
+    def __init__(self, version: int, services: list):
+        """
+        :param version: Номер версии каталога.
+        :param services: Записи таблицы Services.
+        """
+
+        self.version = version
+        self.services = tuple(dict(i) for i in services)
+        self.services_dict = {i['name']: i for i in self.services}
+
+        # Расчет стоимости заказов (проверяет наличие базовых услуг)
+        self.pricing = PricingEngine(self.services)
+
+        # Дополнительные услуги и подписи кнопок клавиатуры (последняя кнопка - подтверждение выбора)
+        self.additional_services = tuple(i for i in self.services if i['additional_service'])
+        buttons = ['➖' + i['name'] for i in self.additional_services]
+        buttons.append('Подтвердить')
+        self.additional_services_buttons = dict(enumerate(buttons))
+
+
+class ServicesCatalog:
+    """
+    Каталог услуг с обновлением без перезапуска бота.
+
+    `refresh` проверяет, изменилась ли БД: счетчик `table_versions['Services']` учитывает запись через DBManager,
+    `PRAGMA data_version` - запись из других соединений и процессов. Если записи Services отличаются от текущего
+    снимка, строится новый снимок и подменяется одним присваиванием. Если новый каталог построить не удалось
+    (например, удалена базовая услуга), остается прежний снимок.
+
+    Первая версия загружается при первом обращении к `current` (или вызовом `load` при запуске бота).
+    """
+
+    def __init__(self, manager: DBManager):
+        self.manager = manager
+        self._lock = threading.Lock()
+        self._markers = None
+        self._current = None
+        self._checks = 0
+        self._reloads = 0
+        self._failures = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._current is not None
+
+    @property
+    def current(self) -> CatalogSnapshot:
+        snapshot = self._current
+        if snapshot is None:
+            snapshot = self.load()
+        return snapshot
+
+    def load(self) -> CatalogSnapshot:
+        """
+        Загружает первую версию каталога, если она еще не загружена.
+
+        :return: Текущая версия каталога.
+        """
+
+        with self._lock:
+            if self._current is None:
+                self._markers = self._get_markers()
+                self._current = CatalogSnapshot(1, self.manager.get_all_records('Services'))
+            return self._current
+
+    def _get_markers(self) -> tuple:
+        return self.manager.table_versions.get('Services', 0), self.manager.data_version()
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Перестраивает каталог, если таблица Services изменилась.
+
+        :param force: Перечитать таблицу Services без проверки признаков изменения БД.
+        :return: True, если каталог обновлен.
+        """
+
+        if self._current is None:
+            self.load()
+            return True
+
+        with self._lock:
+            self._checks += 1
+            markers = self._get_markers()
+            if not force and markers == self._markers:
+                return False
+            self._markers = markers
+
+            services = [dict(i) for i in self.manager.get_all_records('Services')]
+            current = self._current
+            if services == list(current.services):
+                return False
+
+            try:
+                snapshot = CatalogSnapshot(current.version + 1, services)
+            except Exception as e:
+                self._failures += 1
+                logger.error('Каталог услуг не обновлен, используется версия %s: %s', current.version, e)
+                return False
+
+            self._current = snapshot
+            self._reloads += 1
+            logger.info('Каталог услуг обновлен до версии %s', snapshot.version)
+            return True
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'version': self._current.version if self._current else None,
+            'checks': self._checks,
+            'reloads': self._reloads,
+            'failures': self._failures
+        }
+
+
+services_catalog = ServicesCatalog(db_manager)
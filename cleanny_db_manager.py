@@ -1,17 +1,419 @@
+import asyncio
+import bisect
+import configparser
+import functools
+import logging
+import queue
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from cachetools import LRUCache, TTLCache
+
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA, которые можно задать через раздел DB файла конфигураций
+TUNABLE_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout', 'temp_store')
+
+
+def _create_unique_index(con: sqlite3.Connection, name: str, table: str, column: str) -> bool:
+    """
+    Создает уникальный индекс по столбцу. Если в таблице уже есть дубликаты, создается обычный индекс,
+    чтобы миграция не останавливала запуск бота, а дубликаты можно было разобрать вручную. Обычный индекс,
+    созданный ранее, заменяется уникальным, когда дубликатов не осталось.
+
+    :return: True, если создан уникальный индекс.
+    """
+
+    duplicates = con.execute(
+        f'SELECT {column} FROM {table} WHERE {column} IS NOT NULL GROUP BY {column} HAVING COUNT(*) > 1'
+    ).fetchall()
+    if duplicates:
+        logger.warning(
+            'В таблице %s есть повторяющиеся значения %s (%s), уникальный индекс не создан',
+            table, column, ', '.join(str(i[0]) for i in duplicates)
+        )
+        con.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})')
+        return False
+
+    unique = {i['name']: i['unique'] for i in con.execute(f'PRAGMA index_list({table})')}
+    if unique.get(name) == 0:
+        con.execute(f'DROP INDEX {name}')
+    con.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({column})')
+    return True
+
+
+def _migration_hot_query_indexes(con: sqlite3.Connection) -> None:
+    # Поиск сотрудника по ФИО при распределении заказа
+    con.execute('CREATE INDEX IF NOT EXISTS idx_staff_fio ON Staff (last_name, first_name, surname)')
+    # get_order_frequency: отбор заказов пользователя по дате (покрывающий индекс)
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_date ON Orders (user_id, order_date)')
+    # История заказов (/orders): заказы пользователя по статусу
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_status ON Orders (user_id, status)')
+    # Услуги заказа
+    con.execute('CREATE INDEX IF NOT EXISTS idx_orders_services_order ON OrdersServices (order_id, service_id)')
+
+
+def _migration_unique_tg_ids(con: sqlite3.Connection) -> bool:
+    # get_staff_data, подтверждение заказа сотрудником и get_order_frequency ищут по tg_id.
+    # Пока есть дубликаты, миграция повторяется при каждом запуске
+    users = _create_unique_index(con, 'idx_users_tg_id', 'Users', 'tg_id')
+    staff = _create_unique_index(con, 'idx_staff_tg_id', 'Staff', 'tg_id')
+    return users and staff
+
+
+def _migration_auto_assign_jobs(con: sqlite3.Connection) -> None:
+    # Отложенные задачи автоматического распределения заказов (переживают перезапуск бота)
+    con.execute('''CREATE TABLE IF NOT EXISTS AutoAssignJobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INT NOT NULL,
+        msg_id INT,
+        chat_id INT,
+        run_at INT NOT NULL,
+        FOREIGN KEY (order_id) REFERENCES Orders(id)
+    )''')
+    con.execute('CREATE INDEX IF NOT EXISTS idx_auto_assign_jobs_order ON AutoAssignJobs (order_id)')
+
+
+def _migration_bookings_index(con: sqlite3.Connection) -> None:
+    # Распределение заказов (BOOKINGS_QUERY): принятые заказы в диапазоне дат (покрывающий индекс)
+    con.execute(
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_appointment '
+        'ON Orders (status, appointment_datetime, staff_id, total_time)'
+    )
+
+
+def _migration_auto_assign_escalation(con: sqlite3.Connection) -> None:
+    # Время передачи заказа админу: такие заказы не распределяются повторно после перезапуска
+    con.execute('ALTER TABLE AutoAssignJobs ADD COLUMN escalated_at INT')
+
+
+# Упорядоченный список миграций схемы: (версия, описание, функция). Миграция, вернувшая False, выполнена
+# не полностью: ее изменения сохраняются, но версия не записывается, и миграция повторяется при следующем запуске
+MIGRATIONS = [
+    (1, 'Индексы для частых запросов', _migration_hot_query_indexes),
+    (2, 'Уникальные tg_id в Users и Staff', _migration_unique_tg_ids),
+    (3, 'Таблица AutoAssignJobs', _migration_auto_assign_jobs),
+    (4, 'Индекс заказов по статусу и дате', _migration_bookings_index),
+    (5, 'Передача заказов админу в AutoAssignJobs', _migration_auto_assign_escalation),
+]
+
+
+class OrderFrequencyCounter:
+    """
+    Скользящий счетчик заказов пользователей за последние `window` секунд.
+
+    Для каждого пользователя (по tg_id) хранится отсортированная очередь дат заказов из окна: старые даты
+    отбрасываются при чтении, новые заказы добавляются при записи в Orders. Записи старше `reconcile_interval`
+    считаются устаревшими и перечитываются из БД, что исправляет расхождения (например, после записи
+    из другого процесса).
+    """
+
+    def __init__(self, window: int = 30 * 24 * 3600, reconcile_interval: int = 3600):
+        self.window = window
+        self.reconcile_interval = reconcile_interval
+        self._dates = {}
+        self._loaded_at = {}
+        self._lock = threading.Lock()
+
+    def _count(self, dates: deque, now: float) -> int:
+        start = now - self.window
+        while dates and dates[0] < start:
+            dates.popleft()
+        if not dates or dates[-1] <= now:
+            return len(dates)
+        return bisect.bisect_right(dates, now)
+
+    def get(self, tg_id: int, now: float) -> int or None:
+        """
+        :return: Количество заказов в окне или None, если данных о пользователе нет или они устарели.
+        """
+
+        with self._lock:
+            dates = self._dates.get(tg_id)
+            if dates is None or now - self._loaded_at[tg_id] > self.reconcile_interval:
+                return None
+            return self._count(dates, now)
+
+    def load(self, tg_id: int, dates: list, now: float) -> int:
+        """
+        Заменяет данные о пользователе датами заказов, прочитанными из БД.
+
+        :return: Количество заказов в окне.
+        """
+
+        with self._lock:
+            self._dates[tg_id] = deque(sorted(dates))
+            self._loaded_at[tg_id] = now
+            return self._count(self._dates[tg_id], now)
+
+    def add(self, tg_id: int, order_date: float) -> None:
+        with self._lock:
+            dates = self._dates.get(tg_id)
+            if dates is None:
+                return
+            if dates and order_date < dates[-1]:
+                bisect.insort(dates, order_date)
+            else:
+                dates.append(order_date)
+
+    def invalidate(self, tg_id: int = None) -> None:
+        with self._lock:
+            if tg_id is None:
+                self._dates.clear()
+                self._loaded_at.clear()
+            else:
+                self._dates.pop(tg_id, None)
+                self._loaded_at.pop(tg_id, None)
+
+    def reconcile(self, now: float = None) -> None:
+        """
+        Удаляет устаревшие записи, чтобы при следующем обращении они были перечитаны из БД.
+        """
+
+        now = now or datetime.now().timestamp()
+        with self._lock:
+            for tg_id in [k for k, v in self._loaded_at.items() if now - v > self.reconcile_interval]:
+                del self._dates[tg_id]
+                del self._loaded_at[tg_id]
+
+
+class UserProfileCache:
+    """
+    LRU-кэш профилей пользователей (записей таблицы Users) по tg_id.
+
+    Профили загружаются из БД при первом обращении, а при записи в Users через DBManager кэш обновляется
+    сразу (write-through). Незарегистрированные пользователи запоминаются на `missing_ttl` секунд, чтобы каждое
+    их обновление не приводило к запросу в БД: регистрация через DBManager сразу снимает отметку, а пользователь,
+    который зарегистрировался в другом процессе, будет найден после ее истечения.
+    """
+
+    def __init__(self, maxsize: int = 10000, missing_ttl: float = 60):
+        self.hits = 0
+        self.misses = 0
+        self._profiles = LRUCache(maxsize=maxsize)
+        self._missing = TTLCache(maxsize=maxsize, ttl=missing_ttl)
+        self._lock = threading.Lock()
+
+    def get(self, tg_id: int) -> dict or None:
+        """
+        :return: Профиль пользователя или None, если его нет в кэше.
+        """
+
+        with self._lock:
+            profile = self._profiles.get(tg_id)
+            if profile is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return profile
+
+    def is_missing(self, tg_id: int) -> bool:
+        """
+        :return: True, если пользователь недавно не был найден в БД.
+        """
+
+        with self._lock:
+            return tg_id in self._missing
+
+    def mark_missing(self, tg_id: int) -> None:
+        with self._lock:
+            self._missing[tg_id] = True
+
+    def put(self, record: dict) -> dict:
+        """
+        Сохраняет профиль. Если профиль уже есть в кэше, он обновляется на месте, чтобы изменения были
+        видны всем, кто получил его раньше.
+
+        :return: Профиль из кэша.
+        """
+
+        with self._lock:
+            self._missing.pop(record['tg_id'], None)
+            profile = self._profiles.get(record['tg_id'])
+            if profile is None:
+                profile = self._profiles[record['tg_id']] = dict(record)
+            else:
+                profile.update(record)
+            return profile
+
+    def invalidate(self, tg_id: int = None) -> None:
+        with self._lock:
+            if tg_id is None:
+                self._profiles.clear()
+                self._missing.clear()
+            else:
+                self._profiles.pop(tg_id, None)
+                self._missing.pop(tg_id, None)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'profiles': len(self._profiles),
+            'missing': len(self._missing),
+            'maxsize': self._profiles.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
 
 
 class DBManager:
-    def __init__(self, db_name):
+    def __init__(self, db_name, pool_size: int = 0, pragmas: dict = None, user_cache_size: int = 10000):
+        """
+        :param db_name: Путь к файлу базы данных.
+        :param pool_size: Количество соединений для чтения. При 0 все запросы идут через одно соединение,
+        иначе включается пул: одно соединение для записи и `pool_size` соединений для чтения в режиме WAL.
+        :param pragmas: Словарь PRAGMA (см. `TUNABLE_PRAGMAS`), применяемых к каждому соединению.
+        :param user_cache_size: Максимальное количество профилей пользователей в кэше.
+        """
+
         if not hasattr(self, '_initialized'):
             self._initialized = True
-            self.con = sqlite3.connect(db_name, check_same_thread=False)
-            self.con.row_factory = sqlite3.Row
+            self.db_name = db_name
+            self.pool_size = pool_size
+            self.pragmas = dict(pragmas or {})
+            if pool_size and 'journal_mode' not in self.pragmas:
+                self.pragmas['journal_mode'] = 'WAL'
+
+            # Соединение для записи (и для чтения, если пул не используется)
+            self.con = self._connect()
             self.cur = self.con.cursor()
+            self._write_lock = threading.RLock()
+
+            # Схема БД (таблица -> множество полей) и кэш текстов запросов для методов CRUD
+            self._schema = None
+            self._statements = {}
+
+            # Счетчики изменений таблиц, увеличиваются при каждой записи через insert_record/update_record
+            self.table_versions = {}
+
+            # Частота заказов пользователей за последние 30 дней
+            self.order_frequency = OrderFrequencyCounter()
+
+            # Профили пользователей по tg_id
+            self.user_profiles = UserProfileCache(user_cache_size)
+
+            # Соединения только для чтения
+            self._readers = queue.Queue()
+            for _ in range(pool_size):
+                reader = self._connect()
+                reader.execute('PRAGMA query_only = 1')
+                self._readers.put(reader)
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=256)
+        con.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if name not in TUNABLE_PRAGMAS:
+                raise ValueError(f'Недопустимый PRAGMA: {name}')
+            con.execute(f'PRAGMA {name} = {value}')
+        return con
+
+    @contextmanager
+    def _reader(self):
+        """
+        Выдает соединение для чтения из пула, либо основное соединение, если пул не используется.
+        """
+
+        if not self.pool_size:
+            yield self.con
+            return
+
+        con = self._readers.get()
+        try:
+            yield con
+        finally:
+            self._readers.put(con)
+
+    @contextmanager
+    def _writer(self):
+        """
+        Выдает соединение для записи внутри транзакции. Запись выполняется строго по одной.
+        """
+
+        with self._write_lock, self.con:
+            yield self.con
+
+    def data_version(self) -> int:
+        """
+        Возвращает `PRAGMA data_version` соединения для записи: значение меняется после фиксации транзакции
+        любым другим соединением (в том числе из другого процесса), но не после собственной записи.
+        """
+
+        with self._write_lock:
+            return self.con.execute('PRAGMA data_version').fetchone()[0]
+
+    def _get_schema(self) -> dict:
+        """
+        Возвращает схему БД, прочитанную из `sqlite_master` и `PRAGMA table_info` при первом обращении.
+        Названия таблиц и полей приводятся к нижнему регистру, так как SQLite к нему не чувствителен.
+        """
+
+        if self._schema is None:
+            with self._reader() as con:
+                tables = [i[0] for i in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+                self._schema = {
+                    table.lower(): {i['name'].lower() for i in con.execute(f"PRAGMA table_info('{table}')")}
+                    for table in tables
+                }
+        return self._schema
+
+    def _reset_schema(self) -> None:
+        self._schema = None
+        self._statements.clear()
+
+    def _statement(self, operation: str, table: str, columns: tuple = ()) -> str:
+        """
+        Возвращает текст запроса для методов CRUD. Запросы кэшируются по (операция, таблица, поля), а названия
+        таблицы и полей проверяются по схеме БД, поэтому ошибка в названии обнаруживается до выполнения запроса.
+
+        :param operation: 'select', 'insert', 'update' или 'delete'.
+        :param table: Название таблицы.
+        :param columns: Поля условия (select), добавляемые (insert) или изменяемые (update) поля.
+        :return: Текст запроса.
+        """
+
+        key = (operation, table, columns)
+        statement = self._statements.get(key)
+        if statement is not None:
+            return statement
+
+        schema = self._get_schema()
+        if table.lower() not in schema:
+            raise ValueError(f'Таблица {table} не существует')
+        unknown = [i for i in columns if i.lower() not in schema[table.lower()]]
+        if unknown:
+            raise ValueError(f'В таблице {table} нет полей: {", ".join(unknown)}')
+
+        if operation == 'select':
+            statement = f'SELECT * FROM {table}'
+            if columns:
+                statement += ' WHERE ' + ' AND '.join([f'{i} = ?' for i in columns])
+        elif operation == 'insert':
+            values = ', '.join(['?' for _ in columns])
+            statement = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({values}) RETURNING *'
+        elif operation == 'update':
+            set_clause = ', '.join([f'{i} = ?' for i in columns])
+            statement = f'UPDATE {table} SET {set_clause} WHERE id = ? RETURNING *'
+        elif operation == 'delete':
+            statement = f'DELETE FROM {table} WHERE ' + ' AND '.join([f'{i} = ?' for i in columns])
+        else:
+            raise ValueError(f'Неизвестная операция: {operation}')
+
+        self._statements[key] = statement
+        return statement
+
+    def close(self) -> None:
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        self.con.close()
 
     def create_db(self) -> None:
-        with self.con:
+        with self._writer():
             # Создание таблицы ServicesEquipment
             self.cur.execute('''CREATE TABLE IF NOT EXISTS ServicesEquipment (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -107,6 +509,61 @@ class DBManager:
                 FOREIGN KEY (order_id) REFERENCES Orders(id)
                 FOREIGN KEY (service_id) REFERENCES Services(id)
             )''')
+        self._reset_schema()
+
+    def get_schema_version(self) -> int:
+        """
+        Возвращает номер последней примененной миграции (0, если миграции не применялись).
+        """
+
+        with self._reader() as con:
+            exists = con.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'SchemaVersion'"
+            ).fetchone()
+            if not exists:
+                return 0
+            return con.execute('SELECT COALESCE(MAX(version), 0) FROM SchemaVersion').fetchone()[0]
+
+    def migrate(self) -> int:
+        """
+        Применяет к БД все миграции из `MIGRATIONS`, которые еще не были применены.
+        Каждая миграция выполняется в отдельной транзакции, повторный вызов ничего не меняет
+        (кроме повтора миграций, выполненных не полностью).
+
+        :return: Номер версии схемы после обновления.
+        """
+
+        with self._write_lock:
+            con = self.con
+            con.execute('''CREATE TABLE IF NOT EXISTS SchemaVersion (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(100),
+                applied_at INT DEFAULT (strftime('%s', 'now')) NOT NULL
+            )''')
+            applied = {i[0] for i in con.execute('SELECT version FROM SchemaVersion')}
+
+            for version, name, migration in MIGRATIONS:
+                if version in applied:
+                    continue
+                try:
+                    con.execute('BEGIN')
+                    complete = migration(con) is not False
+                    if complete:
+                        con.execute('INSERT INTO SchemaVersion (version, name) VALUES (?, ?)', (version, name))
+                    con.commit()
+                except Exception:
+                    con.rollback()
+                    logger.exception('Ошибка при применении миграции %s (%s)', version, name)
+                    raise
+                if complete:
+                    logger.info('Применена миграция %s: %s', version, name)
+                    applied.add(version)
+                else:
+                    logger.warning('Миграция %s (%s) выполнена не полностью, будет повторена при следующем запуске',
+                                   version, name)
+
+            self._reset_schema()
+            return max(applied, default=0)
 
     def get_staff_data(self, tg_id) -> dict or None:
         """
@@ -117,8 +574,8 @@ class DBManager:
         """
 
         query = 'SELECT * FROM Staff WHERE tg_id = ?'
-        with self.con:
-            data = self.con.execute(query, (tg_id, )).fetchone()
+        with self._reader() as con:
+            data = con.execute(query, (tg_id, )).fetchone()
             if data:
                 return dict(data)
             return None
@@ -131,9 +588,9 @@ class DBManager:
         :return: Словарь или None.
         """
 
-        query = f'SELECT * FROM {table}'
-        with self.con:
-            return self.con.execute(query).fetchall()
+        query = self._statement('select', table)
+        with self._reader() as con:
+            return con.execute(query).fetchall()
 
     def get_records(self, table: str, **params: dict) -> list:
         """
@@ -144,10 +601,9 @@ class DBManager:
         :return: Список
         """
 
-        conditions = ' AND '.join([f"{key} = ?" for key in params.keys()])
-        query = f"SELECT * FROM {table} WHERE {conditions}"
-
-        records = self.con.execute(query, tuple(params.values())).fetchall()
+        query = self._statement('select', table, tuple(params.keys()))
+        with self._reader() as con:
+            records = con.execute(query, tuple(params.values())).fetchall()
         if records:
             records = [dict(i) for i in records]
 
@@ -162,17 +618,134 @@ class DBManager:
         :return: Словарь или None
         """
 
-        conditions = ' AND '.join([f"{key} = ?" for key in params.keys()])
-        query = f'''
-            SELECT *
-            FROM {table}
-            WHERE {conditions}
-        '''
-        data = self.con.execute(query, tuple(params.values())).fetchone()
+        query = self._statement('select', table, tuple(params.keys()))
+        with self._reader() as con:
+            data = con.execute(query, tuple(params.values())).fetchone()
         if data:
             return dict(data)
         return data
 
+    def fetch_all(self, query: str, params: tuple = ()) -> list:
+        """
+        Выполнение произвольного SELECT-запроса.
+
+        :param query: Текст запроса.
+        :param params: Параметры запроса.
+        :return: Список словарей.
+        """
+
+        with self._reader() as con:
+            return [dict(i) for i in con.execute(query, params).fetchall()]
+
+    def get_order_details(self, order_id: int) -> dict or None:
+        """
+        Возвращает заказ вместе с данными, нужными для сообщения о заказе: tg_id пользователя, размер скидки,
+        сотрудник и список услуг.
+
+        :param order_id: Идентификатор заказа.
+        :return: Словарь с полями заказа, `user_tg_id`, `discount_value`, `staff_tg_id`, `staff_last_name`,
+        `staff_first_name`, `staff_surname` и `services` - списком словарей (name, price, lead_time,
+        additional_service, quantity_services), или None, если заказ не найден.
+        """
+
+        order_query = '''
+            SELECT Orders.*, Users.tg_id AS user_tg_id, Discounts.discount_value,
+                Staff.tg_id AS staff_tg_id, Staff.last_name AS staff_last_name,
+                Staff.first_name AS staff_first_name, Staff.surname AS staff_surname
+            FROM Orders
+            LEFT JOIN Users ON Orders.user_id = Users.id
+            LEFT JOIN Discounts ON Orders.discount_id = Discounts.id
+            LEFT JOIN Staff ON Orders.staff_id = Staff.id
+            WHERE Orders.id = ?
+        '''
+        services_query = '''
+            SELECT Services.id, Services.name, Services.price, Services.lead_time, Services.additional_service,
+                OrdersServices.quantity_services
+            FROM OrdersServices
+            JOIN Services ON OrdersServices.service_id = Services.id
+            WHERE OrdersServices.order_id = ?
+            ORDER BY OrdersServices.id
+        '''
+        with self._reader() as con:
+            order = con.execute(order_query, (order_id, )).fetchone()
+            if not order:
+                return None
+            order = dict(order)
+            order['services'] = [dict(i) for i in con.execute(services_query, (order_id, ))]
+        return order
+
+    def get_orders_page(self, user_id: int, statuses: tuple, limit: int, after: tuple = None,
+                        before: tuple = None) -> list:
+        """
+        Страница истории заказов пользователя (с ФИО сотрудника), от новых к старым. Постраничный вывод
+        по ключу (order_date, id): стоимость запроса не зависит от номера страницы.
+
+        :param user_id: Идентификатор пользователя в таблице Users.
+        :param statuses: Статусы заказов.
+        :param limit: Количество заказов на странице.
+        :param after: (order_date, id) последнего заказа предыдущей страницы - следующая страница.
+        :param before: (order_date, id) первого заказа текущей страницы - предыдущая страница.
+        :return: Список словарей.
+        """
+
+        placeholders = ', '.join('?' * len(statuses))
+        query = f'''
+            SELECT Orders.*, Staff.first_name, Staff.last_name, Staff.surname
+            FROM Orders
+            JOIN Staff ON Orders.staff_id = Staff.id
+            WHERE Orders.user_id = ? AND Orders.status IN ({placeholders})
+        '''
+        params = (user_id, ) + tuple(statuses)
+        if before is not None:
+            query += ' AND (Orders.order_date, Orders.id) > (?, ?) ORDER BY Orders.order_date, Orders.id LIMIT ?'
+            params += tuple(before) + (limit, )
+        else:
+            if after is not None:
+                query += ' AND (Orders.order_date, Orders.id) < (?, ?)'
+                params += tuple(after)
+            query += ' ORDER BY Orders.order_date DESC, Orders.id DESC LIMIT ?'
+            params += (limit, )
+
+        orders = self.fetch_all(query, params)
+        if before is not None:
+            orders.reverse()
+        return orders
+
+    def count_orders(self, user_id: int, statuses: tuple) -> int:
+        """
+        :param user_id: Идентификатор пользователя в таблице Users.
+        :param statuses: Статусы заказов.
+        :return: Количество заказов пользователя с переданными статусами.
+        """
+
+        placeholders = ', '.join('?' * len(statuses))
+        query = f'SELECT COUNT(*) FROM Orders WHERE user_id = ? AND status IN ({placeholders})'
+        with self._reader() as con:
+            return con.execute(query, (user_id, ) + tuple(statuses)).fetchone()[0]
+
+    def get_unassigned_orders(self, status: str, after: float) -> list:
+        """
+        Заказы без сотрудника и без задачи автоматического распределения (например, бот остановился между
+        добавлением заказа и задачи). Заказы, переданные админу, не учитываются: для них в AutoAssignJobs
+        хранится запись с `escalated_at`.
+
+        :param status: Статус заказа, ожидающего распределения.
+        :param after: Учитываются заказы со временем выполнения позже этого (Unix).
+        :return: Список словарей с полем `id`, по возрастанию времени выполнения.
+        """
+
+        query = '''
+            SELECT Orders.id
+            FROM Orders
+            LEFT JOIN AutoAssignJobs ON AutoAssignJobs.order_id = Orders.id
+            WHERE Orders.status = ?
+            AND Orders.appointment_datetime > ?
+            AND Orders.staff_id IS NULL
+            AND AutoAssignJobs.id IS NULL
+            ORDER BY Orders.appointment_datetime
+        '''
+        return self.fetch_all(query, (status, after))
+
     def get_order_frequency(self, user_id: int) -> int:
         """
         Возвращает число - частоту заказов пользователя за текущий месяц.
@@ -181,22 +754,93 @@ class DBManager:
         :return: Целое число
         """
 
-        # Получаем текущую дату и вычитаем из нее 30 дней
-        current_date = datetime.now()
-        start_date = current_date - timedelta(days=30)
-
-        current_date = int(current_date.timestamp())
-        start_date = int(start_date.timestamp())
+        current_date = int(datetime.now().timestamp())
+        frequency = self.order_frequency.get(user_id, current_date)
+        if frequency is not None:
+            return frequency
 
+        # Нет данных в счетчике - читаем даты заказов за последние 30 дней из БД.
+        # Блокировка записи гарантирует, что новый заказ не появится между чтением и загрузкой в счетчик.
+        start_date = current_date - self.order_frequency.window
         query = '''
-            SELECT Orders.* 
+            SELECT Orders.order_date
             FROM Orders
             JOIN Users ON Orders.user_id = Users.id
-            WHERE order_date BETWEEN ? AND ?
+            WHERE order_date >= ?
             AND Users.tg_id = ?
         '''
-        data = self.con.execute(query, (start_date, current_date, user_id)).fetchall()
-        return len(data)
+        with self._write_lock:
+            with self._reader() as con:
+                dates = [i[0] for i in con.execute(query, (start_date, user_id))]
+            return self.order_frequency.load(user_id, dates, current_date)
+
+    def get_user(self, tg_id: int) -> dict or None:
+        """
+        Возвращает профиль пользователя из кэша, при промахе - из таблицы Users.
+
+        :param tg_id: Идентификатор пользователя в Telegram.
+        :return: Словарь с данными пользователя или None, если пользователь не зарегистрирован.
+        """
+
+        profile = self.user_profiles.get(tg_id)
+        if profile is not None or self.user_profiles.is_missing(tg_id):
+            return profile
+        return self.load_user(tg_id)
+
+    def load_user(self, tg_id: int) -> dict or None:
+        """
+        Читает профиль пользователя из таблицы Users и сохраняет его в кэш (или отмечает, что пользователь
+        не зарегистрирован).
+
+        :param tg_id: Идентификатор пользователя в Telegram.
+        :return: Словарь с данными пользователя или None, если пользователь не зарегистрирован.
+        """
+
+        # Блокировка записи гарантирует, что в кэш не попадет профиль, измененный между чтением и сохранением
+        with self._write_lock:
+            user = self.get_record('Users', tg_id=tg_id)
+            if not user:
+                self.user_profiles.mark_missing(tg_id)
+                return None
+            return self.user_profiles.put(user)
+
+    def _after_write(self, table: str, record: dict, updated_columns=None) -> None:
+        """
+        Учитывает запись в БД: увеличивает счетчик изменений таблицы, обновляет счетчик частоты заказов
+        и кэш профилей пользователей. Вызывается под блокировкой записи.
+
+        :param table: Название таблицы.
+        :param record: Добавленная или обновленная запись.
+        :param updated_columns: Измененные поля (None для новой записи).
+        """
+
+        self.table_versions[table] = self.table_versions.get(table, 0) + 1
+
+        columns = set(updated_columns or ())
+        if table == 'Orders' and updated_columns is None:
+            # Новый заказ
+            user = self.con.execute('SELECT tg_id FROM Users WHERE id = ?', (record['user_id'], )).fetchone()
+            if user and record['order_date'] is not None:
+                self.order_frequency.add(user['tg_id'], record['order_date'])
+        elif table == 'Orders' and {'user_id', 'order_date'} & columns:
+            self.order_frequency.invalidate()
+        elif table == 'Users' and 'tg_id' in columns:
+            self.order_frequency.invalidate()
+
+        if table == 'Users':
+            if 'tg_id' in columns:
+                # Прежний tg_id неизвестен
+                self.user_profiles.invalidate()
+            if record.get('tg_id') is not None:
+                self.user_profiles.put(record)
+
+    def _insert(self, con: sqlite3.Connection, table: str, record: dict) -> dict:
+        """
+        Добавляет запись внутри уже открытой транзакции и возвращает ее вместе со значениями по умолчанию.
+        """
+
+        sql_query = self._statement('insert', table, tuple(record.keys()))
+        return dict(con.execute(sql_query, tuple(record.values())).fetchone())
 
     def insert_record(self, table: str, **kwargs) -> dict:
         """
@@ -208,20 +852,61 @@ class DBManager:
         :return: Метод возвращает словарь с добавленной записью или пустой словарь, если запись не была добавлена.
         """
 
-        columns = ', '.join(kwargs.keys())
-        values = ', '.join(['?' for _ in kwargs.values()])
-        sql_query = f"INSERT INTO {table} ({columns}) VALUES ({values})"
-
         try:
-            with self.con:
-                self.cur.execute(sql_query, tuple(kwargs.values()))
-                rec_id = self.cur.lastrowid
-                self.cur.execute(f'SELECT * FROM {table} WHERE id = ?', (rec_id, ))
-                return dict(self.cur.fetchone())
+            with self._write_lock:
+                with self._writer() as con:
+                    record = self._insert(con, table, kwargs)
+                self._after_write(table, record)
+                return record
         except Exception as e:
             print(f"Ошибка при добавлении записи в таблицу {table}: {e}")
             return {}
 
+    def insert_many(self, table: str, records: list) -> list:
+        """
+        Добавление нескольких записей в таблицу одной транзакцией. Если хотя бы одна запись не была добавлена,
+        транзакция откатывается целиком.
+
+        :param table: Название таблицы.
+        :param records: Список словарей вида поле - значение.
+        :return: Список добавленных записей или пустой список, если записи не были добавлены.
+        """
+
+        try:
+            with self._write_lock:
+                with self._writer() as con:
+                    inserted = [self._insert(con, table, record) for record in records]
+                for record in inserted:
+                    self._after_write(table, record)
+                return inserted
+        except Exception:
+            logger.exception('Ошибка при добавлении записей в таблицу %s', table)
+            return []
+
+    def insert_order(self, order: dict, services: list) -> dict:
+        """
+        Добавление заказа вместе с его услугами одной транзакцией.
+
+        :param order: Словарь с полями заказа (таблица Orders).
+        :param services: Список словарей с полями таблицы OrdersServices без `order_id`.
+        :return: Словарь с добавленным заказом, где под ключом `services` - добавленные записи OrdersServices,
+        или пустой словарь, если заказ не был добавлен (в этом случае не добавляются и услуги).
+        """
+
+        try:
+            with self._write_lock:
+                with self._writer() as con:
+                    rec = self._insert(con, 'Orders', order)
+                    lines = [self._insert(con, 'OrdersServices', {**i, 'order_id': rec['id']}) for i in services]
+                self._after_write('Orders', rec)
+                for line in lines:
+                    self._after_write('OrdersServices', line)
+                rec['services'] = lines
+                return rec
+        except Exception:
+            logger.exception('Ошибка при добавлении заказа')
+            return {}
+
     def update_record(self, table: str, record_id: int, **kwargs) -> dict:
         """
         Обновление записи в таблице.
@@ -235,34 +920,197 @@ class DBManager:
             print("Нет данных для обновления")
             return {}
 
-        set_clause = ', '.join([f"{column} = ?" for column in kwargs.keys()])
-        sql_query = f"UPDATE {table} SET {set_clause} WHERE id = ?"
-
         try:
-            with self.con:
-                cursor = self.con.cursor()
+            sql_query = self._statement('update', table, tuple(kwargs.keys()))
+            with self._writer() as con:
                 values = tuple(kwargs.values()) + (record_id,)
-                cursor.execute(sql_query, values)
-                rows_updated = cursor.rowcount
-                if rows_updated > 0:
-                    cursor.execute(f"SELECT * FROM {table} WHERE id = ?", (record_id,))
-                    updated_record = cursor.fetchone()
-                    if updated_record:
-                        updated_record_dict = dict(updated_record)
-                        print("Запись успешно обновлена")
-                        return updated_record_dict
+                updated_record = con.execute(sql_query, values).fetchone()
+                if updated_record:
+                    updated_record_dict = dict(updated_record)
+                    self._after_write(table, updated_record_dict, kwargs.keys())
+                    print("Запись успешно обновлена")
+                    return updated_record_dict
                 print("Запись не была обновлена")
                 return {}
         except Exception as e:
             print(f"Ошибка при обновлении записи в таблице {table}: {e}")
             return {}
 
+    def assign_order(self, order_id: int, staff_id: int, status: str, pending_status: str) -> dict:
+        """
+        Назначает заказ сотруднику, только если заказ еще ожидает распределения. Статус проверяется и меняется
+        одним запросом, поэтому заказ, который одновременно принимает сотрудник и распределяет планировщик,
+        достается только одному из них.
+
+        :param order_id: Идентификатор заказа.
+        :param staff_id: Идентификатор сотрудника в таблице Staff.
+        :param status: Новый статус заказа.
+        :param pending_status: Статус заказа, ожидающего распределения.
+        :return: Обновленный заказ или пустой словарь, если заказ уже распределен, отменен или не найден.
+        """
+
+        query = 'UPDATE Orders SET staff_id = ?, status = ? WHERE id = ? AND status = ? RETURNING *'
+        try:
+            with self._writer() as con:
+                rec = con.execute(query, (staff_id, status, order_id, pending_status)).fetchone()
+                if not rec:
+                    return {}
+                rec = dict(rec)
+                self._after_write('Orders', rec, ('staff_id', 'status'))
+                return rec
+        except Exception:
+            logger.exception('Ошибка при назначении заказа %s', order_id)
+            return {}
+
+    def delete_records(self, table: str, **params) -> int:
+        """
+        Удаление записей из таблицы по переданным параметрам.
+
+        :param table: Название таблицы.
+        :param params: Словарь с параметрами (хотя бы один).
+        :return: Количество удаленных записей.
+        """
+
+        if not params:
+            raise ValueError('Не переданы параметры для удаления')
+
+        try:
+            sql_query = self._statement('delete', table, tuple(params.keys()))
+            with self._write_lock:
+                with self._writer() as con:
+                    rows_deleted = con.execute(sql_query, tuple(params.values())).rowcount
+                if rows_deleted:
+                    self.table_versions[table] = self.table_versions.get(table, 0) + 1
+                    if table in ('Orders', 'Users'):
+                        self.order_frequency.invalidate()
+                    if table == 'Users':
+                        self.user_profiles.invalidate()
+            return rows_deleted
+        except Exception:
+            logger.exception('Ошибка при удалении записей из таблицы %s', table)
+            return 0
+
+
+class AsyncDBManager:
+    """
+    Асинхронная обертка над DBManager.
+
+    Запросы выполняются в отдельном пуле потоков, поэтому медленная запись на диск не блокирует цикл событий.
+    Количество ожидающих запросов ограничено `max_queue`: при переполнении очереди обработчики ждут
+    освобождения места, а не накапливают задачи в пуле.
+    """
+
+    def __init__(self, manager: DBManager, max_workers: int = 1, max_queue: int = 100):
+        self.manager = manager
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+        self._semaphore = asyncio.Semaphore(max_queue)
+
+    async def _run(self, func, *args, **kwargs):
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Выполняет в пуле потоков БД функцию, которая обращается к БД через `manager` (например, загрузку
+        каталога услуг), чтобы соединения использовались только потоками пула.
+        """
+
+        return await self._run(func, *args, **kwargs)
+
+    async def migrate(self) -> int:
+        return await self._run(self.manager.migrate)
+
+    async def get_staff_data(self, tg_id) -> dict or None:
+        return await self._run(self.manager.get_staff_data, tg_id)
+
+    async def get_all_records(self, table: str) -> list:
+        return await self._run(self.manager.get_all_records, table)
+
+    async def get_records(self, table: str, **params) -> list:
+        return await self._run(self.manager.get_records, table, **params)
+
+    async def get_record(self, table: str, **params) -> dict or None:
+        return await self._run(self.manager.get_record, table, **params)
+
+    async def fetch_all(self, query: str, params: tuple = ()) -> list:
+        return await self._run(self.manager.fetch_all, query, params)
+
+    async def get_order_details(self, order_id: int) -> dict or None:
+        return await self._run(self.manager.get_order_details, order_id)
+
+    async def get_orders_page(self, user_id: int, statuses: tuple, limit: int, after: tuple = None,
+                              before: tuple = None) -> list:
+        return await self._run(self.manager.get_orders_page, user_id, statuses, limit, after, before)
+
+    async def count_orders(self, user_id: int, statuses: tuple) -> int:
+        return await self._run(self.manager.count_orders, user_id, statuses)
+
+    async def get_unassigned_orders(self, status: str, after: float) -> list:
+        return await self._run(self.manager.get_unassigned_orders, status, after)
+
+    async def get_order_frequency(self, user_id: int) -> int:
+        return await self._run(self.manager.get_order_frequency, user_id)
+
+    async def get_user(self, tg_id: int) -> dict or None:
+        profile = self.manager.user_profiles.get(tg_id)
+        if profile is not None or self.manager.user_profiles.is_missing(tg_id):
+            return profile
+        return await self._run(self.manager.load_user, tg_id)
+
+    async def insert_record(self, table: str, **kwargs) -> dict:
+        return await self._run(self.manager.insert_record, table, **kwargs)
+
+    async def insert_many(self, table: str, records: list) -> list:
+        return await self._run(self.manager.insert_many, table, records)
+
+    async def insert_order(self, order: dict, services: list) -> dict:
+        return await self._run(self.manager.insert_order, order, services)
+
+    async def update_record(self, table: str, record_id: int, **kwargs) -> dict:
+        return await self._run(self.manager.update_record, table, record_id, **kwargs)
+
+    async def assign_order(self, order_id: int, staff_id: int, status: str, pending_status: str) -> dict:
+        return await self._run(self.manager.assign_order, order_id, staff_id, status, pending_status)
+
+    async def delete_records(self, table: str, **params) -> int:
+        return await self._run(self.manager.delete_records, table, **params)
+
+    def shutdown(self) -> None:
+        """
+        Дожидается выполнения оставшихся запросов и останавливает пул потоков.
+        """
+
+        self._executor.shutdown(wait=True)
+
+
+# Настройки БД из файла конфигураций (раздел DB необязателен)
+config = configparser.ConfigParser()
+config.read('resources/config.ini')
+
+db_pragmas = {
+    name: config.get('DB', name)
+    for name in TUNABLE_PRAGMAS
+    if config.has_option('DB', name)
+}
+db_pool_size = config.getint('DB', 'pool_size', fallback=0)
 
-db_manager = DBManager("cleanny_db.db")
+db_manager = DBManager(
+    config.get('DB', 'path', fallback='cleanny_db.db'),
+    pool_size=db_pool_size,
+    pragmas=db_pragmas,
+    user_cache_size=config.getint('DB', 'user_cache_size', fallback=10000)
+)
+async_db_manager = AsyncDBManager(
+    db_manager,
+    max_workers=db_pool_size + 1,
+    max_queue=config.getint('DB', 'max_queue', fallback=100)
+)
 
 
 def main():
     db_manager.create_db()
+    db_manager.migrate()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,82 @@
+import bisect
+import threading
+
+from cleanny_db_manager import DBManager, db_manager
+
+
+class DiscountIndex:
+    """
+    Индекс активных скидок в памяти.
+
+    Скидки из таблицы Discounts (только `active = 1`) хранятся отсортированными по порогу `orders_frequency`
+    вместе с массивом лучших скидок на префиксе, поэтому поиск наибольшей доступной скидки - один bisect.
+
+    Индекс перестраивается при первом обращении после изменения БД (как `catalog.ServicesCatalog`): счетчик
+    `table_versions['Discounts']` учитывает запись через DBManager, `PRAGMA data_version` - запись из других
+    соединений и процессов (например, правку скидок вручную), а также после вызова `invalidate`.
+    Проверка и перестроение обращаются к БД, поэтому из обработчиков `best_discount` вызывается в пуле потоков БД
+    (`AsyncDBManager.run`).
+    """
+
+    def __init__(self, manager: DBManager):
+        self.manager = manager
+        self._thresholds = []
+        self._best = []
+        self._markers = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._markers = None
+
+    def _get_markers(self) -> tuple:
+        return self.manager.table_versions.get('Discounts', 0), self.manager.data_version()
+
+    def _refresh(self) -> bool:
+        """
+        Перестраивает индекс, если БД изменилась. Вызывается под блокировкой.
+
+        :return: True, если индекс перестроен.
+        """
+
+        markers = self._get_markers()
+        if markers == self._markers:
+            return False
+        self._load()
+        self._markers = markers
+        return True
+
+    def _load(self) -> None:
+        discounts = [
+            i for i in self.manager.get_records('Discounts', active=1)
+            if i['orders_frequency'] is not None and i['discount_value'] is not None
+        ]
+        discounts.sort(key=lambda i: i['orders_frequency'])
+
+        thresholds = []
+        best = []
+        for discount in discounts:
+            if not best or discount['discount_value'] > best[-1]['discount_value']:
+                best.append(discount)
+            else:
+                best.append(best[-1])
+            thresholds.append(discount['orders_frequency'])
+
+        self._thresholds = thresholds
+        self._best = best
+
+    def best_discount(self, frequency: int) -> dict or None:
+        """
+        Возвращает наибольшую активную скидку, доступную при переданной частоте заказов.
+
+        :param frequency: Частота заказов пользователя за последние 30 дней.
+        :return: Запись из таблицы Discounts в виде словаря или None, если скидка не положена.
+        """
+
+        with self._lock:
+            self._refresh()
+            ind = bisect.bisect_right(self._thresholds, frequency)
+            return self._best[ind - 1] if ind else None
+
+
+discount_index = DiscountIndex(db_manager)
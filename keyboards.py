@@ -0,0 +1,39 @@
+import functools
+
+
+# Кэшированные функции построения клавиатур (имя -> функция)
+_cached_keyboards = {}
+
+
+def cached_keyboard(maxsize: int = 128):
+    """
+    Декоратор для функций, строящих клавиатуру по своим аргументам: готовые клавиатуры хранятся в LRU-кэше
+    и переиспользуются. Возвращаемые клавиатуры общие для всех вызовов, изменять их нельзя.
+
+    :param maxsize: Максимальное количество клавиатур в кэше.
+    """
+
+    def decorator(func):
+        cached = functools.lru_cache(maxsize=maxsize)(func)
+        _cached_keyboards[func.__name__] = cached
+        return cached
+
+    return decorator
+
+
+def keyboard_stats() -> dict:
+    """
+    :return: Статистика кэшей клавиатур: попадания, промахи, размер и доля попаданий.
+    """
+
+    stats = {}
+    for name, func in _cached_keyboards.items():
+        info = func.cache_info()
+        total = info.hits + info.misses
+        stats[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'hit_rate': info.hits / total if total else 0.0
+        }
+    return stats
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+
+from outbound import PRIORITY_NORMAL, priority
+
+
+logger = logging.getLogger(__name__)
+
+
+class Delivery:
+    """
+    Результат доставки одному получателю.
+    """
+
+    __slots__ = ('recipient', 'result', 'error', 'latency')
+
+    def __init__(self, recipient: str, result=None, error: Exception = None, latency: float = 0.0):
+        self.recipient = recipient
+        self.result = result
+        self.error = error
+        self.latency = latency
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Notifier:
+    """
+    Одновременная рассылка оповещений нескольким получателям (сотрудник, чат админов, клиент).
+
+    Ошибка доставки одному получателю не прерывает доставку остальным: она записывается в результат
+    и в журнал. Для каждого получателя ведется статистика задержки доставки.
+    """
+
+    def __init__(self):
+        self._stats = {}
+
+    async def _deliver(self, recipient: str, factory) -> Delivery:
+        started = time.monotonic()
+        try:
+            result = await factory()
+        except Exception as e:
+            logger.warning('Оповещение не доставлено получателю %s: %s', recipient, e)
+            delivery = Delivery(recipient, error=e, latency=time.monotonic() - started)
+        else:
+            delivery = Delivery(recipient, result=result, latency=time.monotonic() - started)
+
+        stats = self._stats.setdefault(recipient, {'sent': 0, 'failed': 0, 'latency': 0.0, 'max_latency': 0.0})
+        stats['sent' if delivery.ok else 'failed'] += 1
+        stats['latency'] += delivery.latency
+        stats['max_latency'] = max(stats['max_latency'], delivery.latency)
+        return delivery
+
+    async def notify(self, deliveries: dict, priorities: dict = None) -> dict:
+        """
+        Выполняет доставки одновременно.
+
+        :param deliveries: Словарь получатель - функция без аргументов, возвращающая корутину отправки
+        (например `lambda: bot.send_message(...)`).
+        :param priorities: Приоритет исходящих запросов для получателей (см. `outbound.priority`).
+        :return: Словарь получатель - `Delivery`.
+        """
+
+        priorities = priorities or {}
+        tasks = {}
+        for recipient, factory in deliveries.items():
+            # Задача получает приоритет из контекста, в котором создана
+            with priority(priorities.get(recipient, PRIORITY_NORMAL)):
+                tasks[recipient] = asyncio.create_task(self._deliver(recipient, factory))
+
+        results = await asyncio.gather(*tasks.values())
+        return dict(zip(tasks.keys(), results))
+
+    @property
+    def stats(self) -> dict:
+        return {
+            recipient: {
+                'sent': i['sent'],
+                'failed': i['failed'],
+                'avg_latency_ms': i['latency'] / (i['sent'] + i['failed']) * 1000,
+                'max_latency_ms': i['max_latency'] * 1000
+            }
+            for recipient, i in self._stats.items()
+        }
@@ -0,0 +1,280 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+
+
+logger = logging.getLogger(__name__)
+
+# Очереди исходящих сообщений: чем меньше число, тем раньше отправка
+PRIORITY_HIGH = 0  # Предложения заказов сотрудникам
+PRIORITY_NORMAL = 1  # Ответы пользователям
+PRIORITY_LOW = 2  # Копии сообщений в чат админов
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+# Приоритет запросов, отправляемых из текущей задачи
+_priority = contextvars.ContextVar('outbound_priority', default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def priority(level: int):
+    """
+    Задает приоритет всех запросов к Telegram внутри блока `with`.
+
+    :param level: Один из `PRIORITIES`.
+    """
+
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Ограничение частоты: `rate` запросов в секунду с допустимым всплеском до `capacity` запросов.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        """
+        :return: Через сколько секунд можно отправить запрос (0 - можно сейчас).
+        """
+
+        self._refill(now)
+        wait = 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """
+        Запрещает запросы на `seconds` секунд (ответ Telegram с retry_after).
+        """
+
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class _Request:
+    __slots__ = ('make_request', 'bot', 'method', 'future', 'priority', 'enqueued_at', 'attempts')
+
+    def __init__(self, make_request, bot: Bot, method: TelegramMethod, future: asyncio.Future, priority: int):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.future = future
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """
+    Очередь исходящих запросов к Telegram с учетом ограничений на частоту отправки.
+
+    Подключается как middleware сессии бота (`bot.session.middleware(...)`), поэтому через нее проходят все
+    запросы, адресованные чату (отправка, редактирование, удаление сообщений), в том числе `message.answer`.
+    Остальные запросы (getUpdates, setWebhook и т.д.) выполняются напрямую. Запросы отправляются в порядке
+    приоритета (см. `priority`) с соблюдением общего лимита и лимита на чат; чат, для которого лимит исчерпан,
+    не задерживает сообщения в другие чаты. При ответе Telegram с retry_after чат приостанавливается
+    и запрос повторяется.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 group_rate: float = 20 / 60, group_burst: float = 5, max_retries: int = 5, max_chats: int = 10000):
+        """
+        :param global_rate: Общий лимит запросов в секунду.
+        :param chat_rate: Лимит запросов в секунду в личный чат.
+        :param chat_burst: Допустимый всплеск запросов в личный чат.
+        :param group_rate: Лимит запросов в секунду в группу.
+        :param group_burst: Допустимый всплеск запросов в группу.
+        :param max_retries: Максимальное количество повторов запроса после retry_after.
+        :param max_chats: Количество чатов, при превышении которого удаляются лимиты неактивных чатов.
+        """
+
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chats = {}
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._deferred = {}
+        self._in_flight = set()
+        self._task = None
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self._latency = {i: [0, 0.0, 0.0] for i in PRIORITIES}
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        if isinstance(chat_id, str) and chat_id.lstrip('-').isdigit():
+            chat_id = int(chat_id)
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                self._prune()
+            # Идентификаторы групп и каналов отрицательные, у имен каналов (@name) - свой лимит как у групп
+            group = not isinstance(chat_id, int) or chat_id < 0
+            bucket = self._chats[chat_id] = TokenBucket(
+                self.group_rate if group else self.chat_rate,
+                self.group_burst if group else self.chat_burst
+            )
+        return bucket
+
+    def _prune(self) -> None:
+        # Лимит полностью восстановившегося чата ничем не отличается от нового
+        now = time.monotonic()
+        for chat_id in [k for k, v in self._chats.items() if v.delay(now) == 0 and v.tokens >= v.capacity]:
+            del self._chats[chat_id]
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod):
+        if self._task is None or getattr(method, 'chat_id', None) is None:
+            return await make_request(bot, method)
+
+        request = _Request(make_request, bot, method, asyncio.get_running_loop().create_future(), _priority.get())
+        self._put(request)
+        return await request.future
+
+    def _put(self, request: _Request) -> None:
+        self._queue.put_nowait((request.priority, next(self._seq), request))
+
+    def _defer(self, request: _Request, delay: float) -> None:
+        def put():
+            del self._deferred[request]
+            self._put(request)
+
+        self._deferred[request] = asyncio.get_running_loop().call_later(delay, put)
+
+    async def _run(self) -> None:
+        while True:
+            _, _, request = await self._queue.get()
+            if request.future.done():
+                # Вызвавшая задача отменена
+                continue
+
+            now = time.monotonic()
+            chat_bucket = self._bucket(request.method.chat_id)
+            chat_delay = chat_bucket.delay(now)
+            if chat_delay > 0:
+                self._defer(request, chat_delay)
+                continue
+
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+
+            chat_bucket.consume()
+            self.global_bucket.consume()
+            task = asyncio.create_task(self._send(request))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, request: _Request) -> None:
+        request.attempts += 1
+        try:
+            result = await request.make_request(request.bot, request.method)
+        except TelegramRetryAfter as e:
+            if request.attempts > self.max_retries:
+                self._fail(request, e)
+                return
+            logger.warning('Превышен лимит отправки в чат %s, повтор через %s с', request.method.chat_id, e.retry_after)
+            self.retries += 1
+            self._bucket(request.method.chat_id).pause(e.retry_after)
+            self._defer(request, e.retry_after)
+        except Exception as e:
+            self._fail(request, e)
+        else:
+            self.sent += 1
+            latency = self._latency[request.priority]
+            elapsed = time.monotonic() - request.enqueued_at
+            latency[0] += 1
+            latency[1] += elapsed
+            latency[2] = max(latency[2], elapsed)
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def _fail(self, request: _Request, error: Exception) -> None:
+        self.failed += 1
+        if not request.future.done():
+            request.future.set_exception(error)
+
+    @property
+    def depth(self) -> int:
+        """
+        Количество запросов, ожидающих отправки.
+        """
+
+        return self._queue.qsize() + len(self._deferred)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'queued': self.depth,
+            'in_flight': len(self._in_flight),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'latency_ms': {
+                level: {
+                    'count': count,
+                    'avg': total / count * 1000 if count else 0.0,
+                    'max': peak * 1000
+                }
+                for level, (count, total, peak) in self._latency.items()
+            }
+        }
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Дожидается отправки накопленных запросов (не дольше `timeout` секунд) и останавливает очередь.
+        """
+
+        deadline = time.monotonic() + timeout
+        while (self.depth or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Неотправленные запросы завершаются ошибкой, чтобы не ждать их вечно
+        error = RuntimeError('Очередь исходящих сообщений остановлена')
+        for request, handle in self._deferred.items():
+            handle.cancel()
+            self._fail(request, error)
+        self._deferred.clear()
+        while not self._queue.empty():
+            _, _, request = self._queue.get_nowait()
+            self._fail(request, error)
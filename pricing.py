@@ -0,0 +1,180 @@
+import functools
+from typing import NamedTuple
+
+import numpy as np
+
+
+# Базовые услуги калькулятора
+ROOM = '1 Комната'
+BATHROOM = '1 Санузел'
+EXTRA_ROOM = '+1 Комната'
+EXTRA_BATHROOM = '+1 Санузел'
+
+
+def to_minor(value) -> int:
+    """
+    Переводит сумму в рублях (в т.ч. DECIMAL из БД) в копейки.
+    """
+
+    return int(round(float(value) * 100))
+
+
+def to_major(minor: int) -> int or float:
+    """
+    Переводит сумму в копейках в рубли: целое число, если копеек нет.
+    """
+
+    return minor // 100 if minor % 100 == 0 else round(minor / 100, 2)
+
+
+class Quote(NamedTuple):
+    """
+    Расчет стоимости заказа. Суммы - в копейках, время - в минутах.
+    """
+
+    base_price: int  # Комнаты и санузлы
+    services_price: int  # Дополнительные услуги
+    discount: int  # Скидка в процентах
+    discount_amount: int
+    total_price: int
+    minutes: int
+    services: tuple  # id выбранных дополнительных услуг
+
+    @property
+    def hours(self) -> float:
+        return self.minutes / 60
+
+
+class PricingEngine:
+    """
+    Расчет стоимости заказа по каталогу услуг.
+
+    Таблица Services один раз компилируется в массивы цен (в копейках) и длительностей (в минутах),
+    индексированные позицией услуги; набор дополнительных услуг кодируется битовой маской по этим позициям.
+    Расчеты - целочисленные, результаты `quote` кэшируются по ключу (комнаты, санузлы, маска, скидка).
+    Движок неизменяем: при изменении каталога создается новый.
+    """
+
+    def __init__(self, services: list, cache_size: int = 4096):
+        """
+        :param services: Записи таблицы Services.
+        :param cache_size: Максимальное количество расчетов в кэше.
+        """
+
+        services = sorted((dict(i) for i in services), key=lambda i: i['id'])
+        self.ids = tuple(i['id'] for i in services)
+        self.names = tuple(i['name'] for i in services)
+        self.prices = np.array([to_minor(i['price'] or 0) for i in services], dtype=np.int64)
+        self.minutes = np.array([int(round(float(i['lead_time'] or 0) * 60)) for i in services], dtype=np.int64)
+        self.position = {service_id: ind for ind, service_id in enumerate(self.ids)}
+        self.by_name = {name: ind for ind, name in enumerate(self.names)}
+
+        # Дополнительные услуги в порядке кнопок клавиатуры
+        self.additional = tuple(i['id'] for i in services if i['additional_service'])
+
+        room, bathroom = self.by_name[ROOM], self.by_name[BATHROOM]
+        extra_room, extra_bathroom = self.by_name[EXTRA_ROOM], self.by_name[EXTRA_BATHROOM]
+        self._base = (int(self.prices[room] + self.prices[bathroom]), int(self.minutes[room] + self.minutes[bathroom]))
+        self._extra_room = (int(self.prices[extra_room]), int(self.minutes[extra_room]))
+        self._extra_bathroom = (int(self.prices[extra_bathroom]), int(self.minutes[extra_bathroom]))
+
+        self._quote = functools.lru_cache(maxsize=cache_size)(self._compute)
+
+    def service_id(self, name: str) -> int:
+        return self.ids[self.by_name[name]]
+
+    def price_of(self, service_id: int) -> int:
+        """
+        :return: Цена услуги в копейках.
+        """
+
+        return int(self.prices[self.position[service_id]])
+
+    def mask(self, services) -> int:
+        """
+        :param services: id дополнительных услуг.
+        :return: Битовая маска услуг.
+        """
+
+        mask = 0
+        for service_id in services:
+            mask |= 1 << self.position[service_id]
+        return mask
+
+    def _compute(self, rooms: int, bathrooms: int, mask: int, discount: int) -> Quote:
+        base_price = self._base[0] + (rooms - 1) * self._extra_room[0] + (bathrooms - 1) * self._extra_bathroom[0]
+        minutes = self._base[1] + (rooms - 1) * self._extra_room[1] + (bathrooms - 1) * self._extra_bathroom[1]
+
+        services = []
+        services_price = 0
+        ind = 0
+        while mask >> ind:
+            if mask >> ind & 1:
+                services.append(self.ids[ind])
+                services_price += int(self.prices[ind])
+                minutes += int(self.minutes[ind])
+            ind += 1
+
+        price = base_price + services_price
+        # Скидка округляется до копейки по правилам округления
+        discount_amount = (price * discount + 50) // 100
+        return Quote(base_price, services_price, discount, discount_amount, price - discount_amount, minutes,
+                     tuple(services))
+
+    def quote(self, rooms: int = 1, bathrooms: int = 1, services=(), discount: int = 0) -> Quote:
+        """
+        Рассчитывает стоимость заказа.
+
+        :param rooms: Количество комнат (не меньше 1).
+        :param bathrooms: Количество санузлов (не меньше 1).
+        :param services: id выбранных дополнительных услуг.
+        :param discount: Скидка в процентах.
+        :return: Расчет стоимости.
+        """
+
+        return self._quote(rooms, bathrooms, self.mask(services), discount)
+
+    def quote_many(self, rooms, bathrooms, masks, discounts) -> dict:
+        """
+        Рассчитывает стоимость для множества вариантов заказа одновременно (векторно). Маски хранятся
+        в int64, поэтому каталог должен содержать не больше 63 услуг.
+
+        :param rooms: Последовательность количеств комнат.
+        :param bathrooms: Последовательность количеств санузлов.
+        :param masks: Последовательность битовых масок дополнительных услуг (см. `mask`).
+        :param discounts: Последовательность скидок в процентах.
+        :return: Словарь массивов numpy: base_price, services_price, discount_amount, total_price, minutes.
+        """
+
+        rooms = np.asarray(rooms, dtype=np.int64) - 1
+        bathrooms = np.asarray(bathrooms, dtype=np.int64) - 1
+        masks = np.asarray(masks, dtype=np.int64)
+        discounts = np.asarray(discounts, dtype=np.int64)
+
+        selected = (masks[:, None] >> np.arange(len(self.ids), dtype=np.int64)) & 1
+        base_price = self._base[0] + rooms * self._extra_room[0] + bathrooms * self._extra_bathroom[0]
+        services_price = selected @ self.prices
+        minutes = (
+            self._base[1] + rooms * self._extra_room[1] + bathrooms * self._extra_bathroom[1]
+            + selected @ self.minutes
+        )
+        price = base_price + services_price
+        discount_amount = (price * discounts + 50) // 100
+        return {
+            'base_price': base_price,
+            'services_price': services_price,
+            'discount_amount': discount_amount,
+            'total_price': price - discount_amount,
+            'minutes': minutes
+        }
+
+    @property
+    def stats(self) -> dict:
+        info = self._quote.cache_info()
+        total = info.hits + info.misses
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'hit_rate': info.hits / total if total else 0.0
+        }
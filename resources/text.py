@@ -129,6 +129,18 @@ ERROR_MSG = 'Произошла ошибка, приносим свои изви
 
 EMPTY_ORDER_HISTORY = 'В настоящее время ваша история заказов пуста'
 
+SESSION_EXPIRED_MSG = 'Данные заказа устарели, начните заново: /calculate'
+
+SERVICES_RELOADED_MSG = 'Каталог услуг обновлен, текущая версия: {version}'
+SERVICES_NOT_RELOADED_MSG = 'Каталог услуг не изменился, текущая версия: {version}'
+
+ORDER_HISTORY_PAGE_MSG = 'История заказов (страница {page} из {pages}, всего заказов: {count})\n\n' \
+                         '{orders}\n\n' \
+                         '{discount}'
+ORDER_HISTORY_SEPARATOR = '\n\n—————\n\n'
+PREV_PAGE_BTN = '« Назад'
+NEXT_PAGE_BTN = 'Вперед »'
+
 DISCOUNT_MSG = 'Ваша скидка составляет: {discount} %'
 
 ADD_STAFF = 'Перешлите сообщение от сотрудника'
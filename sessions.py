@@ -0,0 +1,240 @@
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+# Данные диалога с пользователем
+SESSION_FIELDS = (
+    'user',
+    'order',
+    'order_detail',
+    'order_info',
+    'orders_services',
+    'services',
+    'reg',
+    'add_staff',
+    'add_staff_data',
+    'input_name',
+    'input_last_name',
+    'input_surname',
+    'input_address',
+    'input_phone',
+    'input_email',
+    'active_order',
+    'catalog',
+    'fsm',
+)
+_SESSION_FIELDS_SET = frozenset(SESSION_FIELDS)
+
+
+class Session:
+    """
+    Данные диалога с пользователем.
+
+    Поля хранятся в слотах, а доступ к ним - как к словарю (`session['order']`, `session.get('reg')`),
+    поэтому сессию можно использовать вместо словаря пользователя. Поля, которых нет в `SESSION_FIELDS`,
+    недопустимы.
+    """
+
+    __slots__ = SESSION_FIELDS + ('user_id', 'last_access')
+
+    def __init__(self, user_id: int, **fields):
+        self.user_id = user_id
+        self.last_access = time.monotonic()
+        self.update(fields)
+
+    @staticmethod
+    def _check(key: str) -> None:
+        if key not in _SESSION_FIELDS_SET:
+            raise KeyError(key)
+
+    def __getitem__(self, key: str):
+        self._check(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value) -> None:
+        self._check(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self._check(key)
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return key in _SESSION_FIELDS_SET and hasattr(self, key)
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def get(self, key: str, default=None):
+        if key not in _SESSION_FIELDS_SET:
+            return default
+        return getattr(self, key, default)
+
+    def pop(self, key: str, *default):
+        if key in self:
+            value = getattr(self, key)
+            delattr(self, key)
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def keys(self) -> list:
+        return [i for i in SESSION_FIELDS if hasattr(self, i)]
+
+    def update(self, fields=(), **kwargs) -> None:
+        for key, value in dict(fields, **kwargs).items():
+            self[key] = value
+
+    def clear(self) -> None:
+        for key in self.keys():
+            delattr(self, key)
+
+
+class SessionStore:
+    """
+    Хранилище сессий пользователей с ограничением размера.
+
+    Сессии хранятся в порядке последнего обращения: сессии, к которым не обращались дольше `ttl` секунд,
+    удаляются методом `evict_idle`, а при превышении `max_sessions` удаляются самые давние сессии.
+    Обращение по ключу (`store[user_id]`) создает сессию, если ее нет. Начальные поля новой сессии
+    (в том числе при присваивании `store[user_id] = {...}`) берутся из `loader`, поэтому данные, которые
+    хранятся вне сессии (профиль пользователя), не теряются при ее удалении.
+
+    Хранилище не потокобезопасно: все обращения, в том числе `evict_idle`, выполняются в цикле событий.
+    """
+
+    def __init__(self, ttl: float = 3600, max_sessions: int = 10000, loader=None):
+        """
+        :param ttl: Время жизни неактивной сессии в секундах.
+        :param max_sessions: Максимальное количество сессий в памяти.
+        :param loader: Функция, принимающая user_id и возвращающая словарь с начальными полями сессии.
+        """
+
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self._sessions = OrderedDict()
+
+    def _touch(self, session: Session) -> Session:
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(session.user_id)
+        return session
+
+    def _add(self, session: Session) -> Session:
+        self._sessions[session.user_id] = session
+        self._sessions.move_to_end(session.user_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted_lru += 1
+        return session
+
+    def _new(self, user_id: int) -> Session:
+        fields = self.loader(user_id) if self.loader else None
+        return Session(user_id, **(fields or {}))
+
+    def __getitem__(self, user_id: int) -> Session:
+        session = self._sessions.get(user_id)
+        if session is not None:
+            self.hits += 1
+            return self._touch(session)
+
+        self.misses += 1
+        return self._add(self._new(user_id))
+
+    def __setitem__(self, user_id: int, fields) -> None:
+        session = self._new(user_id)
+        session.update(fields)
+        self._add(session)
+
+    def __delitem__(self, user_id: int) -> None:
+        del self._sessions[user_id]
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, user_id: int, default=None):
+        """
+        Возвращает существующую сессию, не создавая новую.
+        """
+
+        session = self._sessions.get(user_id)
+        if session is None:
+            return default
+        return self._touch(session)
+
+    def evict_idle(self) -> int:
+        """
+        Удаляет сессии, неактивные дольше `ttl` секунд.
+
+        :return: Количество удаленных сессий.
+        """
+
+        deadline = time.monotonic() - self.ttl
+        evicted = 0
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.last_access > deadline:
+                break
+            del self._sessions[user_id]
+            evicted += 1
+        self.evicted_idle += evicted
+        return evicted
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted_idle': self.evicted_idle,
+            'evicted_lru': self.evicted_lru,
+        }
+
+
+class SessionStorage(BaseStorage):
+    """
+    Хранилище состояний FSM aiogram в сессиях `SessionStore`, чтобы состояния подчинялись тем же
+    ограничениям по времени жизни и количеству, что и остальные данные диалога.
+    """
+
+    def __init__(self, store: SessionStore):
+        self.store = store
+
+    def _fsm(self, key: StorageKey) -> dict:
+        session = self.store[key.user_id]
+        if 'fsm' not in session:
+            session['fsm'] = {}
+        return session['fsm'].setdefault((key.chat_id, key.thread_id, key.destiny), {'state': None, 'data': {}})
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._fsm(key)['state'] = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> str or None:
+        return self._fsm(key)['state']
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        self._fsm(key)['data'] = data.copy()
+
+    async def get_data(self, key: StorageKey) -> dict:
+        return self._fsm(key)['data'].copy()
+
+    async def close(self) -> None:
+        pass
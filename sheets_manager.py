@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import time
+
+from gspread.exceptions import APIError
+from gspread.utils import ValueInputOption, rowcol_to_a1
+
+
+logger = logging.getLogger(__name__)
+
+# Коды ответов Google API, при которых запрос стоит повторить позже
+RETRYABLE_CODES = (429, 500, 502, 503, 504)
+
+
+class SheetsUnavailableError(ConnectionError):
+    """
+    Google таблица еще не открыта.
+    """
+
+
+class LazySpreadsheet:
+    """
+    Google таблица, которая открывается в фоне после запуска бота (авторизация и открытие таблицы - запросы к Google).
+
+    До подключения обращение к листам вызывает `SheetsUnavailableError`: `SheetsWriter` копит изменения
+    в очереди, `ScheduleCache` отдает пустой график. Подключение повторяется с экспоненциальной задержкой,
+    пока не завершится успешно.
+    """
+
+    def __init__(self, opener, retry_interval: float = 5, max_retry_interval: float = 300):
+        """
+        :param opener: Функция без аргументов, открывающая таблицу (`gspread.Spreadsheet`).
+        Выполняется в отдельном потоке.
+        :param retry_interval: Задержка перед первым повтором подключения в секундах.
+        :param max_retry_interval: Максимальная задержка между повторами в секундах.
+        """
+
+        self._opener = opener
+        self._spreadsheet = None
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.attempts = 0
+
+    @property
+    def available(self) -> bool:
+        return self._spreadsheet is not None
+
+    def get_worksheet(self, index: int):
+        if self._spreadsheet is None:
+            raise SheetsUnavailableError('Google таблица еще не открыта')
+        return self._spreadsheet.get_worksheet(index)
+
+    async def connect(self) -> None:
+        """
+        Открывает таблицу, повторяя попытки до успеха.
+        """
+
+        delay = self.retry_interval
+        while self._spreadsheet is None:
+            self.attempts += 1
+            try:
+                self._spreadsheet = await asyncio.to_thread(self._opener)
+            except Exception as e:
+                logger.warning('Не удалось открыть Google таблицу (попытка %s), повтор через %s с: %s',
+                               self.attempts, delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_interval)
+
+
+class ScheduleCache:
+    """
+    Кэш листа с графиком работы сотрудников.
+
+    Лист читается целиком (`get_all_records`) не чаще раза в `ttl` секунд, остальные запросы обслуживаются
+    из памяти. Собственные изменения сразу применяются к кэшу, а после их записи в Google Sheets кэш
+    перечитывается, чтобы подхватить правки, внесенные в таблицу вручную. Изменения, которые `SheetsWriter`
+    еще не записал, применяются к перечитанному листу повторно, иначе они терялись бы до записи.
+    """
+
+    def __init__(self, spreadsheet, worksheet: int = 0, ttl: float = 60, key_column: str = 'ФИО'):
+        """
+        :param spreadsheet: Таблица gspread (`gspread.Spreadsheet`) или `LazySpreadsheet`.
+        :param worksheet: Индекс листа с графиком.
+        :param ttl: Время жизни кэша в секундах.
+        :param key_column: Столбец, по значению которого определяется строка (ФИО сотрудника).
+        """
+
+        self.spreadsheet = spreadsheet
+        self.worksheet = worksheet
+        self.ttl = ttl
+        self.key_column = key_column
+        self.hits = 0
+        self.misses = 0
+        # Увеличивается, когда перечитанный лист отличается от кэша (правки вручную). Собственные изменения
+        # (`apply`) версию не меняют: их уже учел тот, кто их внес
+        self.version = 0
+        self._rows = {}
+        self._staff_rows = {}
+        self._row_keys = ()
+        self._records = None
+        self._loaded_at = 0
+        self._lock = asyncio.Lock()
+        # Фоновая запись в этот лист (`SheetsWriter` регистрирует себя сам)
+        self.writer = None
+
+    def _load(self) -> list:
+        return self.spreadsheet.get_worksheet(self.worksheet).get_all_records()
+
+    def _is_fresh(self) -> bool:
+        return self._records is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get_records(self) -> list:
+        """
+        Возвращает строки листа в виде списка словарей (как `get_all_records`). Словари не следует изменять.
+        """
+
+        if self._is_fresh():
+            self.hits += 1
+            return self._records
+
+        async with self._lock:
+            # Пока ждали блокировку, лист мог перечитать другой обработчик
+            if self._is_fresh():
+                self.hits += 1
+                return self._records
+            self.misses += 1
+            try:
+                records = await asyncio.to_thread(self._load)
+            except SheetsUnavailableError:
+                # Таблица еще не открыта: отдаем прежний график, если он был загружен, иначе пустой
+                return self._records if self._records is not None else []
+            if self.writer is not None:
+                for (row, col), value in self.writer.pending_cells(self.worksheet).items():
+                    self._set_cell(records, row, col, value)
+            if records != self._records:
+                self._records = records
+                self.version += 1
+                self._build_index()
+            self._loaded_at = time.monotonic()
+            return self._records
+
+    def _build_index(self) -> None:
+        """
+        Строит индекс ФИО -> номер строки листа. Индекс перестраивается только если изменился набор строк.
+        """
+
+        keys = tuple(i.get(self.key_column) for i in self._records)
+        if keys == self._row_keys:
+            return
+        self._row_keys = keys
+        # Первая строка листа - заголовки
+        self._rows = {key: ind + 2 for ind, key in enumerate(keys) if key}
+        self._staff_rows = {}
+
+    def row_of(self, fio: str) -> int or None:
+        """
+        :param fio: ФИО сотрудника в том виде, в котором оно записано на листе.
+        :return: Номер строки листа или None, если строка не найдена или лист еще не загружен.
+        """
+
+        return self._rows.get(fio)
+
+    def row_of_staff(self, staff: dict) -> int or None:
+        """
+        :param staff: Запись из таблицы Staff.
+        :return: Номер строки сотрудника на листе или None.
+        """
+
+        row = self._staff_rows.get(staff['id'])
+        if row is None:
+            row = self.row_of(f"{staff['last_name']} {staff['first_name']} {staff['surname']}")
+            if row is not None:
+                self._staff_rows[staff['id']] = row
+        return row
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0
+
+    def apply(self, row: int or str, col: int, value) -> None:
+        """
+        Применяет изменение ячейки к кэшу, не дожидаясь записи в Google Sheets.
+
+        :param row: Номер строки листа или значение ключевого столбца (ФИО).
+        :param col: Номер столбца.
+        :param value: Новое значение.
+        """
+
+        if self._records is not None:
+            self._set_cell(self._records, row, col, value)
+
+    def _set_cell(self, records: list, row: int or str, col: int, value) -> None:
+        if not isinstance(row, int):
+            row = self.row_of(row) or 0
+        # Первая строка листа - заголовки
+        ind = row - 2
+
+        if 0 <= ind < len(records):
+            record = records[ind]
+            headers = list(record.keys())
+            if 0 < col <= len(headers):
+                record[headers[col - 1]] = value
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+class SheetsWriter:
+    """
+    Фоновая запись в Google Sheets.
+
+    Обработчики только ставят изменения ячеек в очередь, а запись выполняется в фоновой задаче раз в
+    `flush_interval` секунд: изменения одного листа объединяются в один запрос `batch_update`, повторные
+    изменения одной ячейки схлопываются (остается последнее значение). При превышении квоты и ошибках сети
+    запись повторяется с экспоненциальной задержкой.
+    """
+
+    def __init__(self, spreadsheet, flush_interval: float = 5, max_backoff: float = 300,
+                 schedule_cache: ScheduleCache = None):
+        """
+        :param spreadsheet: Таблица gspread (`gspread.Spreadsheet`) или `LazySpreadsheet`.
+        :param flush_interval: Период записи накопленных изменений в секундах.
+        :param max_backoff: Максимальная задержка между повторами в секундах.
+        :param schedule_cache: Кэш листа с графиком, который нужно обновлять при записи в этот лист.
+        """
+
+        self.spreadsheet = spreadsheet
+        self.schedule_cache = schedule_cache
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._pending = {}
+        # Изменения, которые записываются прямо сейчас
+        self._inflight = {}
+        self._failures = 0
+        self._retry_at = 0
+        self._task = None
+        if schedule_cache is not None:
+            schedule_cache.writer = self
+
+    def update_cell(self, worksheet: int, row: int or str, col: int, value) -> None:
+        """
+        Ставит изменение ячейки в очередь.
+
+        :param worksheet: Индекс листа.
+        :param row: Номер строки или значение ячейки, по которому строка будет найдена при записи (например ФИО).
+        :param col: Номер столбца.
+        :param value: Новое значение.
+        """
+
+        if isinstance(row, str) and self.schedule_cache and self.schedule_cache.worksheet == worksheet:
+            row = self.schedule_cache.row_of(row) or row
+        self._pending.setdefault(worksheet, {})[(row, col)] = value
+        if self.schedule_cache and self.schedule_cache.worksheet == worksheet:
+            self.schedule_cache.apply(row, col, value)
+
+    def pending_cells(self, worksheet: int) -> dict:
+        """
+        :return: Еще не записанные изменения листа: (строка, столбец) -> значение.
+        """
+
+        cells = dict(self._inflight.get(worksheet, {}))
+        cells.update(self._pending.get(worksheet, {}))
+        return cells
+
+    @property
+    def pending_count(self) -> int:
+        return sum(len(i) for i in self._pending.values())
+
+    def _resolve_row(self, worksheet, row: int or str) -> int or None:
+        if isinstance(row, int):
+            return row
+        # Строки нет в индексе кэша (лист еще не загружен) - ищем ее на листе
+        cell = worksheet.find(row)
+        return cell.row if cell else None
+
+    def _write(self, worksheet_index: int, cells: dict) -> None:
+        worksheet = self.spreadsheet.get_worksheet(worksheet_index)
+        data = []
+        for (row, col), value in cells.items():
+            row_number = self._resolve_row(worksheet, row)
+            if row_number is None:
+                logger.warning('Строка %s не найдена на листе %s, значение %s не записано', row, worksheet_index, value)
+                continue
+            data.append({'range': rowcol_to_a1(row_number, col), 'values': [[value]]})
+        if data:
+            worksheet.batch_update(data, value_input_option=ValueInputOption.user_entered)
+
+    def _requeue(self, worksheet_index: int, cells: dict) -> None:
+        # Более новые значения, поставленные в очередь во время записи, не перезаписываются
+        pending = self._pending.setdefault(worksheet_index, {})
+        for key, value in cells.items():
+            pending.setdefault(key, value)
+
+    async def flush(self) -> bool:
+        """
+        Записывает все накопленные изменения.
+
+        :return: True, если все изменения записаны, False, если часть из них возвращена в очередь для повтора.
+        """
+
+        pending, self._pending = self._pending, {}
+        self._inflight = pending
+        success = True
+        try:
+            for worksheet_index, cells in pending.items():
+                try:
+                    await asyncio.to_thread(self._write, worksheet_index, cells)
+                    if self.schedule_cache and self.schedule_cache.worksheet == worksheet_index:
+                        self.schedule_cache.invalidate()
+                except (APIError, OSError) as e:
+                    if isinstance(e, APIError) and e.code not in RETRYABLE_CODES:
+                        logger.error('Изменения листа %s не записаны в Google Sheets: %s', worksheet_index, e)
+                        continue
+                    logger.warning('Ошибка записи в Google Sheets, повтор позже: %s', e)
+                    self._requeue(worksheet_index, cells)
+                    success = False
+        finally:
+            self._inflight = {}
+
+        if success:
+            self._failures = 0
+            self._retry_at = 0
+        else:
+            self._failures += 1
+            self._retry_at = time.monotonic() + min(self.flush_interval * 2 ** self._failures, self.max_backoff)
+        return success
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # Пока Google таблица не открыта, изменения остаются в очереди
+            if not getattr(self.spreadsheet, 'available', True):
+                continue
+            if self._pending and time.monotonic() >= self._retry_at:
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception('Ошибка фоновой записи в Google Sheets')
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Останавливает фоновую задачу и записывает оставшиеся изменения.
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending:
+            await self.flush()
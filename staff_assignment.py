@@ -0,0 +1,175 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+
+# Ограничения рабочего времени сотрудника
+DAY_LIMIT = 10
+WEEK_LIMIT = 40
+
+# Горизонт планирования: диапазон дат календаря заказа
+HORIZON_DAYS = 90
+
+# Принятые заказы с сотрудником в диапазоне дат (часы заказа + 1 час дороги)
+BOOKINGS_QUERY = '''
+    SELECT Staff.last_name, Staff.first_name, Staff.surname, Orders.appointment_datetime, Orders.total_time
+    FROM Orders
+    JOIN Staff ON Orders.staff_id = Staff.id
+    WHERE Orders.status IN ('Принят', 'Завершен')
+    AND Orders.appointment_datetime BETWEEN ? AND ?
+'''
+
+
+class AssignmentEngine:
+    """
+    Распределение заказов между сотрудниками с учетом загрузки.
+
+    Хранит матрицу сотрудники × дни с забронированными часами и матрицу рабочих дней на горизонте от
+    понедельника текущей недели до последнего дня календаря заказа. Дни текущего месяца берутся из листа
+    с графиком (число в ячейке - забронированные часы, пустая ячейка или текст - выходной), остальные дни
+    считаются рабочими. Часы дня - не меньше суммы принятых заказов из БД: заказы следующего месяца на лист
+    не записываются, и после смены месяца на листе их еще нет.
+    """
+
+    def __init__(self, day_limit: float = DAY_LIMIT, week_limit: float = WEEK_LIMIT,
+                 horizon_days: int = HORIZON_DAYS, key_column: str = 'ФИО'):
+        self.day_limit = day_limit
+        self.week_limit = week_limit
+        self.horizon_days = horizon_days
+        self.key_column = key_column
+        self.staff = []
+        self.start = None
+        self.hours = np.zeros((0, 0))
+        self.available = np.zeros((0, 0), dtype=bool)
+        self._rows = {}
+        self._source = None
+
+    async def refresh(self, schedule_cache, db) -> None:
+        """
+        Перестраивает матрицы, если изменился лист с графиком (версия кэша) или наступил новый день.
+
+        :param schedule_cache: Кэш листа с графиком (`sheets_manager.ScheduleCache`).
+        :param db: Асинхронный менеджер БД (`cleanny_db_manager.AsyncDBManager`).
+        """
+
+        records = await schedule_cache.get_records()
+        today = date.today()
+        source = (schedule_cache.version, today)
+        if source == self._source:
+            return
+
+        start, end = self.horizon(today)
+        start_ts = datetime.combine(start, datetime.min.time()).timestamp()
+        end_ts = datetime.combine(end + timedelta(days=1), datetime.min.time()).timestamp()
+        bookings = await db.fetch_all(BOOKINGS_QUERY, (start_ts, end_ts))
+
+        self.rebuild(records, bookings, today)
+        self._source = source
+
+    def horizon(self, today: date = None) -> tuple:
+        """
+        :return: Первый и последний день горизонта планирования.
+        """
+
+        today = today or date.today()
+        start = today - timedelta(days=today.weekday())
+        return start, today + timedelta(days=self.horizon_days)
+
+    def rebuild(self, records: list, bookings: list = (), today: date = None) -> None:
+        """
+        Перестраивает матрицы.
+
+        :param records: Строки листа с графиком (`get_all_records`).
+        :param bookings: Строки `BOOKINGS_QUERY`. Для дней текущего месяца берется наибольшее из значения
+        на листе и суммы заказов.
+        :param today: Текущая дата.
+        """
+
+        today = today or date.today()
+        start, end = self.horizon(today)
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+        # Дни текущего месяца (они есть на листе) и их номера столбцов
+        sheet_days = [(j, str(d.day)) for j, d in enumerate(days) if (d.year, d.month) == (today.year, today.month)]
+
+        self.start = start
+        self.staff = [i[self.key_column] for i in records if i.get(self.key_column)]
+        self._rows = {fio: ind for ind, fio in enumerate(self.staff)}
+        self.hours = np.zeros((len(self.staff), len(days)))
+        self.available = np.ones((len(self.staff), len(days)), dtype=bool)
+
+        for record in records:
+            ind = self._rows.get(record.get(self.key_column))
+            if ind is None:
+                continue
+            for j, key in sheet_days:
+                value = record.get(key)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.hours[ind, j] = value
+                else:
+                    self.available[ind, j] = False
+
+        booked = np.zeros_like(self.hours)
+        for booking in bookings:
+            fio = f"{booking['last_name']} {booking['first_name']} {booking['surname']}"
+            j = self._column(datetime.fromtimestamp(booking['appointment_datetime']))
+            if fio in self._rows and j is not None:
+                booked[self._rows[fio], j] += float(booking['total_time']) + 1
+        self.hours = np.maximum(self.hours, booked)
+
+    def _column(self, when: datetime) -> int or None:
+        if self.start is None:
+            return None
+        j = (when.date() - self.start).days
+        return j if 0 <= j < self.hours.shape[1] else None
+
+    def candidates(self, when: datetime, hours: float, exclude=()) -> list:
+        """
+        Возвращает сотрудников, которые могут взять заказ, не превысив дневной и недельный лимит часов.
+        Порядок детерминированный: сначала сотрудники без заказов в этот день, затем с меньшей загрузкой
+        за неделю и за день.
+
+        :param when: Дата и время заказа.
+        :param hours: Длительность заказа в часах (вместе с дорогой).
+        :param exclude: ФИО сотрудников, которых не нужно предлагать.
+        :return: Список ФИО.
+        """
+
+        j = self._column(when)
+        if j is None or not self.staff:
+            return []
+
+        week = j // 7
+        week_hours = self.hours[:, week * 7:(week + 1) * 7].sum(axis=1)
+        day_hours = self.hours[:, j]
+
+        fits = (
+            self.available[:, j]
+            & (day_hours + hours <= self.day_limit)
+            & (week_hours + hours <= self.week_limit)
+        )
+        for fio in exclude:
+            if fio in self._rows:
+                fits[self._rows[fio]] = False
+
+        ind = np.flatnonzero(fits)
+        order = np.lexsort((ind, day_hours[ind], week_hours[ind], day_hours[ind] > 0))
+        return [self.staff[i] for i in ind[order]]
+
+    def choose(self, when: datetime, hours: float, exclude=()) -> str or None:
+        candidates = self.candidates(when, hours, exclude)
+        return candidates[0] if candidates else None
+
+    def book(self, fio: str, when: datetime, hours: float) -> float or None:
+        """
+        Добавляет часы заказа сотруднику.
+
+        :return: Забронированные часы сотрудника в этот день или None, если сотрудника или дня нет в матрице.
+        """
+
+        j = self._column(when)
+        ind = self._rows.get(fio)
+        if j is None or ind is None:
+            return None
+        self.hours[ind, j] += hours
+        return float(self.hours[ind, j])
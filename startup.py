@@ -0,0 +1,107 @@
+import asyncio
+import inspect
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Startup:
+    """
+    Инициализация бота после запуска диспетчера.
+
+    Медленные этапы (подключение к Google Sheets, загрузка данных из БД, построение клавиатур) выполняются
+    фоновыми задачами одновременно, этап ждет только те этапы, от которых зависит. Синхронные функции
+    выполняются в отдельном потоке. Ошибка этапа записывается в журнал и не останавливает бота; этапы,
+    зависящие от него, пропускаются. Для каждого этапа сохраняется время выполнения.
+    """
+
+    def __init__(self):
+        self._phases = {}
+        self._tasks = {}
+        self._timings = {}
+        self._started_at = None
+
+    def add(self, name: str, func, requires: tuple = ()) -> None:
+        """
+        Добавляет этап.
+
+        :param name: Название этапа.
+        :param func: Функция без аргументов (корутина или синхронная функция).
+        :param requires: Названия этапов, которые должны успешно завершиться до начала этого этапа.
+        """
+
+        self._phases[name] = (func, tuple(requires))
+
+    async def _run(self, name: str) -> None:
+        func, requires = self._phases[name]
+        timing = self._timings[name]
+
+        for required in requires:
+            await asyncio.wait({self._tasks[required]})
+            if self._timings[required]['status'] != 'ok':
+                timing['status'] = 'skipped'
+                logger.warning('Этап запуска %s пропущен: не выполнен этап %s', name, required)
+                return
+
+        timing['status'] = 'running'
+        started = time.monotonic()
+        timing['started'] = started - self._started_at
+        try:
+            if inspect.iscoroutinefunction(func):
+                await func()
+            else:
+                await asyncio.to_thread(func)
+        except Exception:
+            timing['status'] = 'failed'
+            logger.exception('Ошибка на этапе запуска %s', name)
+        else:
+            timing['status'] = 'ok'
+        timing['duration'] = time.monotonic() - started
+        logger.info('Этап запуска %s: %s за %.3f с', name, timing['status'], timing['duration'])
+
+    def start(self) -> None:
+        """
+        Запускает все этапы фоновыми задачами.
+        """
+
+        self._started_at = time.monotonic()
+        for name in self._phases:
+            self._timings[name] = {'status': 'pending', 'started': None, 'duration': None}
+        for name in self._phases:
+            self._tasks[name] = asyncio.create_task(self._run(name))
+
+    async def wait(self, *names: str) -> bool:
+        """
+        Ждет завершения этапов (всех, если названия не переданы).
+
+        :return: True, если все этапы выполнены успешно.
+        """
+
+        names = names or tuple(self._tasks)
+        await asyncio.wait({self._tasks[i] for i in names})
+        return all(self._timings[i]['status'] == 'ok' for i in names)
+
+    async def stop(self) -> None:
+        """
+        Отменяет незавершенные этапы (например, ожидание подключения к Google Sheets).
+        """
+
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        for timing in self._timings.values():
+            if timing['status'] in ('pending', 'running'):
+                timing['status'] = 'cancelled'
+
+    @property
+    def stats(self) -> dict:
+        return {
+            name: {
+                'status': i['status'],
+                'started_ms': i['started'] * 1000 if i['started'] is not None else None,
+                'duration_ms': i['duration'] * 1000 if i['duration'] is not None else None
+            }
+            for name, i in self._timings.items()
+        }
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import signal
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик запросов вебхука, который отвечает Telegram сразу, а обновления обрабатывает в фоновых
+    задачах, не более `max_tasks` одновременно (остальные ждут своей очереди). При остановке сервера новые
+    обновления не принимаются, а начатые дорабатываются в течение `drain_timeout` секунд.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str = None,
+                 max_tasks: int = 100, drain_timeout: float = 30, **data: Any):
+        """
+        :param dispatcher: Диспетчер.
+        :param bot: Бот.
+        :param secret_token: Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token.
+        :param max_tasks: Максимальное количество одновременно обрабатываемых обновлений.
+        :param drain_timeout: Время ожидания обработки начатых обновлений при остановке в секундах.
+        """
+
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.max_tasks = max_tasks
+        self.drain_timeout = drain_timeout
+        self._semaphore = asyncio.Semaphore(max_tasks)
+        self._closing = False
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+            except Exception:
+                logger.exception('Ошибка обработки обновления %s', update.get('update_id'))
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self._closing:
+            # Telegram повторит доставку обновления после перезапуска
+            return web.Response(status=503)
+        return await super().handle(request)
+
+    @property
+    def active_tasks(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def drain(self) -> None:
+        """
+        Перестает принимать обновления и ждет обработки начатых.
+        """
+
+        self._closing = True
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+
+        logger.info('Ожидание обработки %s обновлений', len(tasks))
+        done, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        if pending:
+            logger.warning('Обработка %s обновлений прервана по таймауту', len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.drain()
+        await super().close()
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, base_url: str, host: str = '127.0.0.1', port: int = 8080,
+                      path: str = '/webhook', secret_token: str = None, max_tasks: int = 100,
+                      drain_timeout: float = 30) -> None:
+    """
+    Запускает сервер aiohttp для приема обновлений через вебхук и работает до получения SIGINT/SIGTERM.
+
+    :param dispatcher: Диспетчер.
+    :param bot: Бот.
+    :param base_url: Внешний адрес сервера (например, адрес обратного прокси), к которому добавляется `path`.
+    :param host: Адрес, на котором сервер принимает соединения.
+    :param port: Порт сервера.
+    :param path: Путь вебхука.
+    :param secret_token: Секрет для проверки запросов от Telegram.
+    :param max_tasks: Максимальное количество одновременно обрабатываемых обновлений.
+    :param drain_timeout: Время ожидания обработки начатых обновлений при остановке в секундах.
+    :return: None
+    """
+
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dispatcher,
+        bot,
+        secret_token=secret_token,
+        max_tasks=max_tasks,
+        drain_timeout=drain_timeout
+    )
+    handler.register(app, path=path)
+    setup_application(app, dispatcher, bot=bot)
+
+    await bot.set_webhook(
+        url=base_url.rstrip('/') + path,
+        secret_token=secret_token,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=min(max_tasks, 100)
+    )
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info('Вебхук запущен на %s:%s%s', host, port, path)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        # Сервер перестает принимать соединения, затем дорабатываются начатые обновления
+        await runner.cleanup()
+        logger.info('Вебхук остановлен')